@@ -5,20 +5,30 @@ import rospy
 import numpy as np
 import math
 import cv2 as cv
-from scipy import signal
-from sklearn.cluster import DBSCAN
-from skimage.morphology import dilation, disk
 from skimage.draw import line
 
 from projet.RRTStarPlanning import *
 from projet.LastChallengeClasses import *
-
-
-from cv_bridge import CvBridge
-
-from sensor_msgs.msg import Image, LaserScan
+from projet.GridLayout import msg_to_grid, fill_grid_msg, robot_cell, cell_offset, PoseTransform
+from projet.ColourClassifier import ColourClassifier
+from projet.RoadGrid import RoadGridProjector
+from projet.LaneTracker import LaneTracker
+from projet.FrameWorker import LatestFrameWorker
+from projet.Perception import lane_blobs, colour_blobs, bottle_clusters
+from projet.PerceptionPool import PerceptionPool
+from projet.BottleTracker import BottleTracker
+from projet.GatePairing import GatePairing
+from projet.FrameView import bgr_view, decode_compressed
+from projet.DebugView import DebugPublisher
+from projet.GridOverlay import GridOverlay
+from projet.Morphology import median, dilate, disk, square
+from projet.CameraBearings import CameraBearings, interval_overlap, associate
+from projet.StageGraph import StageGraph
+
+
+
+from sensor_msgs.msg import Image, CompressedImage, LaserScan, CameraInfo
 from std_msgs.msg import Bool
-import matplotlib.pyplot as plt
 from geometry_msgs.msg import Twist
 from nav_msgs.msg import OccupancyGrid, Odometry
 
@@ -32,27 +42,37 @@ class TurtleController:
             
 
             #This is called "masked frame" but it's mostly a placeholder for visualisation purposes.
-            self.image_pub = rospy.Publisher("/masked_frame", Image, queue_size=1)
+            #Debug outputs are only rendered when someone subscribes (see projet.DebugView)
+            self.debug_image = DebugPublisher("/masked_frame", Image, queue_size=1)
 
             self.cmd_vel_pub = rospy.Publisher("/cmd_vel", Twist, queue_size=1)
 
             #This is called "_road" because previous attempts included a lane extracted from vision.
-            self.occupancy_grid_pub = rospy.Publisher('occupancy_grid_road', OccupancyGrid, queue_size=4)
+            self.debug_grid = DebugPublisher('occupancy_grid_road', OccupancyGrid, queue_size=4)
             
 
+            #Pairing of the bottles into gates, kept across parameter changes (see projet.GatePairing)
+            self.gate_pairing = GatePairing()
+
             #When a GUI changes a param, this gets called.
             rospy.Subscriber("/param_change_alert", Bool, self.get_params)
 
 
 
             self.laser_scan = None #LiDAR data (processed)
-            self.cv_image = None #Raw image 
+            self.cv_image = None #Raw image (read-only view of the message, see projet.FrameView)
             self.image = None #Processed image
-            self.cv_image_rect = None #Image that has had distortion corrected
+            self.cv_image_rect = None #Image that has had distortion corrected (read-only view)
+            self.image_rect_stamp = None
 
             #Turtlebot position and angle (2D plane)
             self.theta = None
             self.pos = None
+            self.odom_stamp = None
+
+            #Frame transforms for the current pose (and grid shape)
+            self.pose_transform = None
+            self.pose_transform_key = None
 
 
 
@@ -84,6 +104,8 @@ class TurtleController:
             #The two occupancy grids. the first one is purely lidar.
             self.occupancy_grid = None
             self.occupancy_grid2 = None
+            self.grid_data = None #Content of the last grid message
+            self.grid_version = 0 #Incremented when the content of the grid changed
 
 
             #The lane estimations
@@ -97,7 +119,14 @@ class TurtleController:
             
 
 
-            self.bridge = CvBridge()
+            #Region of interest masks, by (image shape, polygon)
+            self.roi_masks = {}
+
+            #Birdseye road grid (remap tables), by image shape
+            self.road_projectors = {}
+
+            #Lane fits on the birdseye view, kept from frame to frame
+            self.lane_trackers = {'left': LaneTracker('left'), 'right': LaneTracker('right')}
 
             self.get_params()
 
@@ -112,8 +141,12 @@ class TurtleController:
             self.current_index = 0
 
             #List of all bottles and gates
-            self.bottles = []
-            self.gates = []
+            self.bottles = BottleRegistry() #Array backed (see projet.LastChallengeClasses)
+            self.bottle_tracker = BottleTracker(gate=self.same_bottle_threshold) #Filtered positions, same indices as self.bottles
+            self.gates = GateRegistry(self.bottles, move_tolerance=self.gate_pairing.move_tolerance)
+
+            #Closed gates and bottles drawn on the grid (see projet.GridOverlay)
+            self.overlay = GridOverlay(self.CELLS_PER_METER)
 
             #Number of gates we've passed through
             self.transited_gates = 0
@@ -130,14 +163,30 @@ class TurtleController:
             self.state = 0 #0 exploring, 1 transiting, 2 crossing 
             self.target_gate = None
 
+            #Stages of the last challenge, only run when their inputs changed
+            self.overlay_grid = None
+            self.camera_gates = [] #Gates seen by the camera in the last frame (colour, bearings)
+            self.last_challenge_stages = self.last_challenge_graph()
+
             
+            #The perception stages run in worker processes (0: inline)
+            workers = rospy.get_param("/perception_workers", default=0)
+            self.perception = PerceptionPool(workers) if workers > 0 else None
+
+            #The camera frames are processed on a worker thread, latest frame only.
+            self.image_worker = LatestFrameWorker(self.handle_image, name="image_worker")
+
             rospy.on_shutdown(self.stop_and_clean_up)
 
-            rospy.Subscriber("/camera/image", Image, self.callback_image)
+            if self.camera_compressed:
+                rospy.Subscriber(self.camera_compressed_topic, CompressedImage, self.callback_image)
+            else:
+                rospy.Subscriber("/camera/image", Image, self.callback_image)
             rospy.Subscriber("/occupancy_grid_noroad", OccupancyGrid, self.occupCB)
             rospy.Subscriber("/lidar_data", LaserScan, self.lidarCB)
             rospy.Subscriber("/image_rect_color", Image, self.callback_image_rect)
             rospy.Subscriber("/odom", Odometry, self.odomCB)
+            rospy.Subscriber(self.camera_info_topic, CameraInfo, self.callback_camera_info)
 
 
     def stop_and_clean_up(self):
@@ -152,27 +201,36 @@ class TurtleController:
 
         self.cmd_vel_pub.publish(cmd_twist)
 
+        self.image_worker.stop()
+        self.debug_image.stop()
+        self.debug_grid.stop()
+
+        if not self.perception is None:
+            self.perception.close()
 
 
+
+    def frames(self):
+        """
+            Transforms for the current pose and grid (see projet.GridLayout), only rebuilt when one of them changed.
+        """
+        key = (self.pos, self.theta, self.occupancy_grid.shape[:2])
+        if key != self.pose_transform_key:
+            self.pose_transform = PoseTransform(self.pos, self.theta, key[2], self.CELLS_PER_METER)
+            self.pose_transform_key = key
+        return self.pose_transform
+
     def turtle_to_odom(self, rel):
         """
-            Convert from turtle frame to odom frame
+            Convert from turtle frame (occup grid cells) to odom frame. (x,y) tuple or N x 2 array.
         """
-        rel = self.pathplanner.grid_to_rel(rel)
-        
-        y = self.pos[1] + (math.sin(self.theta) * rel[0] + math.cos(self.theta) * rel[1])
-        x = self.pos[0] + (math.cos(self.theta) * rel[0] - math.sin(self.theta) * rel[1])
-        return (x,y)
+        return self.frames().grid_to_odom(rel)
     
     def odom_to_grid(self, odom):
         """
-            convert from odom frame to turtle(occup grid) frame
+            convert from odom frame to turtle(occup grid) frame. (x,y) tuple or N x 2 array.
         """
-        x_prime = odom[0] - self.pos[0]
-        y_prime = odom[1] - self.pos[1]
-        rel_0 = x_prime * math.cos(self.theta) + y_prime * math.sin(self.theta)
-        rel_1 = -x_prime * math.sin(self.theta) + y_prime * math.cos(self.theta)
-        return self.pathplanner.rel_to_grid((rel_0, rel_1))
+        return self.frames().odom_to_grid(odom)
 
     def odomCB(self, msg:Odometry):
         w,x,y,z = msg.pose.pose.orientation.w, msg.pose.pose.orientation.x, msg.pose.pose.orientation.y, msg.pose.pose.orientation.z 
@@ -180,11 +238,17 @@ class TurtleController:
         self.old_pos = self.pos
         self.theta = math.atan2(2*x*y + 2 * z * w, 1 - 2*y*y - 2*z*z)
         self.pos = (msg.pose.pose.position.x, msg.pose.pose.position.y)
+        self.odom_stamp = msg.header.stamp
         
 
     def occupCB(self, msg):
-        data = np.asarray(msg.data, dtype=np.int8).reshape(msg.info.height, msg.info.width)
+        data = msg_to_grid(msg) #Canonical layout view, see projet.GridLayout
         self.occupancy_grid = np.ma.array(data, mask=data==-1, fill_value=-1)
+
+        #The lidar node sends the same grid again (new stamp) when the scan didn't change, only a new content counts
+        if self.grid_data is None or self.grid_data.shape != data.shape or not np.array_equal(self.grid_data, data):
+            self.grid_data = data.copy()
+            self.grid_version += 1
         self.grid_height = msg.info.width
         self.stamp = msg.header.stamp
         self.grid_width = msg.info.height
@@ -388,9 +452,9 @@ class TurtleController:
         """ 
         obstacles = []
 
-        for i in range(-margin, margin + 1):  # for the margin, check
-            cell_a_margin = (cell_a[0]+i, cell_a[1])
-            cell_b_margin = (cell_b[0]+i, cell_b[1])
+        for i in range(-margin, margin + 1):  # for the margin, check (sideways)
+            cell_a_margin = (cell_a[0], cell_a[1]+i)
+            cell_b_margin = (cell_b[0], cell_b[1]+i)
             for cell in self.traverse_grid(cell_a_margin, cell_b_margin):
                 # print(cell, self.occupancy_grid[cell[0], cell[1]])
                 if (cell[0] * cell[1] < 0) or (cell[0] >= self.occupancy_grid.shape[0]) or (cell[1] >= self.occupancy_grid.shape[1]):
@@ -434,8 +498,15 @@ class TurtleController:
             self.IS_OCCUPIED = rospy.get_param("/occup_osoccupied", default=100)
 
 
+            #Camera input. The compressed stream is decoded at 1/camera_decode_scale of its resolution (1, 2, 4 or 8),
+            #the pixel thresholds of the lane following are given at full resolution and scaled with image_scale.
+            self.camera_compressed = rospy.get_param("/camera_compressed_bool", default=False)
+            self.camera_compressed_topic = rospy.get_param("/camera_compressed_topic", default="/raspicam_node/image/compressed")
+            self.camera_decode_scale = rospy.get_param("/camera_decode_scale", default=1)
+            self.image_scale = 1.0 / self.camera_decode_scale if self.camera_compressed else 1.0
+
             #Lane following
-            self.road_maxwidth = rospy.get_param("/road_maxwidth", default=240)
+            self.road_maxwidth = rospy.get_param("/road_maxwidth", default=240) * self.image_scale
             self.road_lane_offset = rospy.get_param("/road_lane_offset", default=0.3)
 
             #Corridor
@@ -450,17 +521,42 @@ class TurtleController:
             self.bottles_area_threshold = rospy.get_param("/bottles_area_threshold", default=200)
             self.bottles_target_distance = rospy.get_param("/bottles_target_distance", default=0.46)
             self.bottles_tolerance = rospy.get_param("/bottles_tolerance", default=0.06)
+            self.bottles_clustering = rospy.get_param("/bottles_clustering", default="label") #'label' or 'dbscan'
+            self.gate_pairing.configure(self.bottles_target_distance, self.bottles_tolerance)
+
+            #Camera/LiDAR gates association: calibration of the rectified camera (yaml, replaced by the CameraInfo when it comes)
+            self.camera_info_topic = rospy.get_param("/camera_info_topic", default="/camera/camera_info_correct")
+            self.camera_x_offset = rospy.get_param("/camera_x_offset", default=0.0) #Camera in front of the LiDAR (m)
+            self.bottle_radius = rospy.get_param("/bottles_radius", default=0.035)
+            self.gate_colour_min_overlap = rospy.get_param("/gates_colour_min_overlap", default=0.3)
+            self.camera = CameraBearings.from_yaml(rospy.get_param("/camera_calib"), self.camera_x_offset) if rospy.has_param("/camera_calib") else None
 
             self.ang_vel_clip = rospy.get_param("/ang_vel_clip", default=10.0)
 
 
             #Stepline thresholds
             self.stepline_delay = rospy.get_param("/step_last_detection_threshold", default=6.0)
-            self.stepline_upper_area = rospy.get_param("/step_upper_area_threshold", default=2400)
-            self.stepline_lower_area = rospy.get_param("/step_lower_area_threshold", default=3200)
+            self.stepline_upper_area = rospy.get_param("/step_upper_area_threshold", default=2400) * self.image_scale**2
+            self.stepline_lower_area = rospy.get_param("/step_lower_area_threshold", default=3200) * self.image_scale**2
 
             self.max_speed = rospy.get_param("/max_speed", default=0.22)
 
+            #Road occupancy grid from the camera (merged with the LiDAR one)
+            self.road_grid = rospy.get_param("/road_grid_bool", default=True)
+
+
+            ## VISION
+
+            #Region of interest (row start, row stop, column start, column stop) of each colour mask, the rest of the image is ignored.
+            if self.sim:
+                self.vision_rois = {'left': (170, 220, None, None), 'right': (170, 220, None, None), 'stepline': (200, None, None, None)}
+            else:
+                self.vision_rois = {'left': (None, None, None, None), 'right': (350, None, None, None), 'stepline': (None, None, None, None)}
+
+            #Same regions (and closing kernel of the masks) on the reduced image
+            self.vision_rois = {name: tuple(None if i is None else int(i * self.image_scale) for i in roi) for name, roi in self.vision_rois.items()}
+            self.vision_kernel = max(1, round(15 * self.image_scale))
+
 
             ## ROAD
 
@@ -530,22 +626,58 @@ class TurtleController:
             self.green_V_u = rospy.get_param("/green_V_u", default=255)
 
 
+            #Debug visualisation
+            self.debug_max_rate = rospy.get_param("/debug_max_rate", default=5.0) #Hz
+            self.debug_downscale = rospy.get_param("/debug_downscale", default=1.0)
+            self.debug_image.configure(self.debug_max_rate, self.debug_downscale)
+            self.debug_grid.configure(self.debug_max_rate, self.debug_downscale)
+
+
+            #All the colour ranges are compiled in one lookup table, which is only rebuilt here.
+            self.colour_classifier = ColourClassifier({
+                'left': [((self.left_H_l, self.left_S_l, self.left_V_l), (self.left_H_u, self.left_S_u, self.left_V_u))],
+                'right': [((self.right_H_l, self.right_S_l, self.right_V_l), (self.right_H_u, self.right_S_u, self.right_V_u))],
+                'stepline': [((self.stepline1_H_l, self.stepline1_S_l, self.stepline1_V_l), (self.stepline1_H_u, self.stepline1_S_u, self.stepline1_V_u)),
+                             ((self.stepline2_H_l, self.stepline2_S_l, self.stepline2_V_l), (self.stepline2_H_u, self.stepline2_S_u, self.stepline2_V_u))],
+                'blue': [((self.blue_H_l, self.blue_S_l, self.blue_V_l), (self.blue_H_u, self.blue_S_u, self.blue_V_u))],
+                'green': [((self.green_H_l, self.green_S_l, self.green_V_l), (self.green_H_u, self.green_S_u, self.green_V_u))],
+                'yellow': [((self.yellow_H_l, self.yellow_S_l, self.yellow_V_l), (self.yellow_H_u, self.yellow_S_u, self.yellow_V_u))],
+            })
+
         except rospy.ROSException as e:
             rospy.logerr("Failed to get parameters: {}".format(e))
 
 
 
     def callback_image(self, msg):
-        self.cv_image = self.bridge.imgmsg_to_cv2(msg, "bgr8")
+        #Only swap in the newest frame, the processing is done by the image worker
+        self.image_worker.submit(msg)
+
+    def handle_image(self, msg):
+        """
+            Image worker: process the freshest frame (older ones were dropped).
+        """
+        if isinstance(msg, CompressedImage):
+            self.cv_image = decode_compressed(msg, self.camera_decode_scale)
+        else:
+            self.cv_image = bgr_view(msg)
         self.process_image(self.cv_image)
+        rospy.loginfo_throttle(10, "Image worker: " + self.image_worker.stats())
         
 
+    def callback_camera_info(self, msg):
+        if self.camera is None or (self.camera.fx, self.camera.cx, self.camera.width) != (msg.P[0], msg.P[2], msg.width):
+            self.camera = CameraBearings.from_camera_info(msg, self.camera_x_offset)
+
+
     def callback_image_rect(self, msg):
-        self.cv_image_rect = self.bridge.imgmsg_to_cv2(msg, "bgr8")
+        self.cv_image_rect = bgr_view(msg)
+        self.image_rect_stamp = msg.header.stamp
         if self.laser_scan is None:
                 rospy.logwarn("No LiDAR data received!")
                 return
-        if self.step <=2 and self.sim and False:
+        #The road grid is only published (debug), don't compute it if nobody is watching
+        if self.step <=2 and self.sim and self.road_grid and self.debug_grid.wanted():
             self.second_process(self.cv_image_rect)
 
 
@@ -557,8 +689,8 @@ class TurtleController:
         if self.occupancy_grid is None:
             return False
         
-        current_pos = (self.occupancy_grid.shape[0]//2 - 1, 0)
-        goal_pos = (self.occupancy_grid.shape[0]//2 - 1, 12)
+        current_pos = robot_cell(self.occupancy_grid.shape)
+        goal_pos = (current_pos[0] - 12, current_pos[1])
 
         obs = self.check_collision(current_pos, goal_pos, margin=4)
 
@@ -600,7 +732,7 @@ class TurtleController:
         offset = self.road_lane_offset
 
         if self.step == 2 and self.sim:
-            max_width = 175
+            max_width = 175 * self.image_scale
             offset = 0.25
 
         if np.isnan(self.left_lane[1]):
@@ -656,61 +788,39 @@ class TurtleController:
             Kp = -0.02
 
         self.cmd_speed = speed 
-        self.ang_vel = self.error * Kp
-
-    #Function that warps the image
-    def warp(self, img, source_points, destination_points, destn_size):
-        matrix = cv.getPerspectiveTransform(source_points, destination_points)
-        warped_img = cv.warpPerspective(img, matrix, destn_size)
-        return warped_img
-
-    #Function that unwarps the image
-    def unwarp(self, img, source_points, destination_points, source_size):
-        matrix = cv.getPerspectiveTransform(destination_points, source_points)
-        unwarped_img = cv.warpPerspective(img, matrix, source_size)
-        return unwarped_img
+        self.ang_vel = self.error / self.image_scale * Kp #Gains are for full resolution pixels
 
     def preprocessing(self, img):
         #Mask out lanes and stepline
         hsv = cv.cvtColor(img, cv.COLOR_BGR2HSV)
-        if self.sim:
-            lower_yellow = np.array([self.left_H_l,self.left_S_l,self.left_V_l])
-            upper_yellow = np.array([self.left_H_u,self.left_S_u,self.left_V_u])
+        bits = self.colour_classifier.classify(hsv)
 
-            # Define HSV thresholds for red colour
-            lower_right = np.array([self.right_H_l, self.right_S_l, self.right_V_l])
-            upper_right = np.array([self.right_H_u, self.right_S_u, self.right_V_u])
+        mask_left = self.colour_classifier.mask(bits, 'left')
 
-            # Create masks for yellow and white colours
-            mask_left = cv.inRange(hsv, lower_yellow, upper_yellow)
-            mask_right = cv.inRange(hsv, lower_right, upper_right)
+        if self.sim:
+            mask_right = self.colour_classifier.mask(bits, 'right')
 
         else:
-            lower_left = np.array([self.left_H_l, self.left_S_l, self.left_V_l])
-            upper_left = np.array([self.left_H_u, self.left_S_u, self.left_V_u])
-
-            lower_stepline1 = np.array([self.stepline1_H_l, self.stepline1_S_l, self.stepline1_V_l])
-            upper_stepline1 = np.array([self.stepline1_H_u, self.stepline1_S_u, self.stepline1_V_u])
-            lower_stepline2 = np.array([self.stepline2_H_l, self.stepline2_S_l, self.stepline2_V_l])
-            upper_stepline2 = np.array([self.stepline2_H_u, self.stepline2_S_u, self.stepline2_V_u])
-
-
-            mask_left = cv.inRange(hsv, lower_left, upper_left)
-
-            mask_stepline1 = cv.inRange(hsv, lower_stepline1, upper_stepline1)
-            mask_stepline2 = cv.inRange(hsv, lower_stepline2, upper_stepline2)
-            mask_stepline_inter = cv.bitwise_or(mask_stepline1, mask_stepline2)
-            
             kernel = np.ones((15,15), np.uint8)
-            mask_right = cv.morphologyEx(mask_stepline_inter, cv.MORPH_CLOSE, kernel)
-
-        mask_frame = mask_left + mask_right
+            mask_right = cv.morphologyEx(self.colour_classifier.mask(bits, 'stepline'), cv.MORPH_CLOSE, kernel)
 
         return mask_left, mask_right
 
     # Select a certain region
     def regionOfInterest(self,img, polygon):
-        mask = np.zeros_like(img)
+        key = (img.shape, tuple(map(tuple, polygon)))
+        mask = self.roi_masks.get(key)
+        if mask is None:
+            mask = self.roi_mask(img.shape, polygon)
+            self.roi_masks[key] = mask
+
+        masked_img = np.multiply(mask, img)
+        return masked_img
+
+    def roi_mask(self, shape, polygon):
+        """
+            Mask (0/1) of the pixels inside the polygon, computed with broadcasted half-plane tests.
+        """
         x1, y1 = polygon[0]
         x2, y2 = polygon[1]
         x3, y3 = polygon[2]
@@ -724,69 +834,13 @@ class TurtleController:
         b3 = y3 - m3*x3
         b4 = y4 - m4*x4
 
-        for i in range(mask.shape[0]):
-            for j in range(mask.shape[1]):
-                if i>=m1*j+b1 and i>=m2*j+b2 and i>=m3*j+b3 and i<=m4*j+b4:
-                    mask[i][j] = 1
-
-        masked_img = np.multiply(mask, img)
-        return masked_img
-
-    def fitCurve(self,img, lane='left'):
-        # Calculate the histogram of the bottom half of the image
-        histogram = np.sum(img[img.shape[0]//2:,:], axis=0)
-        midpoint = int(histogram.shape[0]/2)
-        
-        # Initial base positions for the left and right x-coordinates
-        if lane == 'left':
-            x_base = np.argmax(histogram[:midpoint])
-        elif lane == 'right':
-            x_base = np.argmax(histogram[midpoint:]) + midpoint
-        else:
-            raise ValueError("Invalid lane specified. Use 'left' or 'right'.")
-
-        # Parameters
-        nwindows = 50
-        margin = 50
-        minpix = 50
-        window_height = int(img.shape[0]/nwindows)
-
-        # Lane finding
-        lane_indices = []
-        x_current = x_base
-        y, x = img.nonzero()
-
-        for window in range(nwindows):
-            win_y_low = img.shape[0] - (window+1) * window_height
-            win_y_high = img.shape[0] - window * window_height
-            win_x_low = x_current - margin
-            win_x_high = x_current + margin
-
-            good_indices = ((y >= win_y_low) & (y < win_y_high) & 
-                            (x >= win_x_low) & (x < win_x_high)).nonzero()[0]
-            lane_indices.append(good_indices)
-
-            if len(good_indices) > minpix:
-                x_current = int(np.mean(x[good_indices]))
-
-        lane_indices = np.concatenate(lane_indices)
-        lanex = x[lane_indices]
-        laney = y[lane_indices]
-        
-        if len(lane_indices) < 3000:
-            return None, None
-
-
-        try:
-            fit = np.polyfit(laney, lanex, 2)
-        except:
-            return None, None
-
-        if lane == 'left':
-            return fit, None
-        else:
-            return None, fit
+        i, j = np.ogrid[:shape[0], :shape[1]]
+        mask = (i>=m1*j+b1) & (i>=m2*j+b2) & (i>=m3*j+b3) & (i<=m4*j+b4)
 
+        mask = mask.astype(np.uint8)
+        if len(shape) == 3:
+            mask = mask[:, :, np.newaxis] #Same mask for all the channels
+        return mask
 
     def estimate_missing_lane(self, detected_fit, lane_side, lane_width_pixels):
         """
@@ -809,150 +863,78 @@ class TurtleController:
         
         return missing_lane_fit
 
-    def findPoints(self, img_shape, left_fit=None, right_fit=None):
-        ploty = np.linspace(0, img_shape[0]-1, img_shape[0])
-
-        LANE_WIDTH_PIXELS = 610 #adjust this for real life ?
-        
-        if left_fit is not None and right_fit is None:
-            right_fit = self.estimate_missing_lane(left_fit, 'left', LANE_WIDTH_PIXELS)
-        elif right_fit is not None and left_fit is None:
-            left_fit = self.estimate_missing_lane(right_fit, 'right', LANE_WIDTH_PIXELS)
-        
-        if left_fit is not None:
-            left_fitx = left_fit[0]*ploty**2 + left_fit[1]*ploty + left_fit[2]
-            pts_left = np.array([np.transpose(np.vstack([left_fitx, ploty]))])
-        else:
-            pts_left = None
-        
-        if right_fit is not None:
-            right_fitx = right_fit[0]*ploty**2 + right_fit[1]*ploty + right_fit[2]
-            pts_right = np.array([np.flipud(np.transpose(np.vstack([right_fitx, ploty])))])
-        else:
-            pts_right = None
-        
-        return pts_left, pts_right
 
 
-    #Function that fills the space between the detected lane curves
-    def fillCurves(self, img_shape, pts_left, pts_right):
-        pts = np.hstack((pts_left, pts_right))
-        img = np.zeros((img_shape[0], img_shape[1], 3), dtype='uint8')
-        cv.fillPoly(img, np.int_([pts]), (255,0,255))
-        return img
+    def road_projector(self, shape):
+        """
+            Birdseye projection for this image size (the remap tables are only computed once).
+        """
+        if not shape in self.road_projectors:
+            height, width = shape[:2]
 
-    #Find radii of lanes to try and estimate a goal pos in the future
-    def radiusOfCurvature(self,img, left_fit, right_fit):
-        y_eval = img.shape[0]//2
-        try:
-            left_radius = -1 * ((1 + (2*left_fit[0]*y_eval + left_fit[1])**2)**1.5) / (2*left_fit[0])
-        except:
-            left_radius = None
-        try:
-            right_radius = -1 * ((1 + (2*right_fit[0]*y_eval + right_fit[1])**2)**1.5) / (2*right_fit[0])
-        except:
-            right_radius = None
-        if left_radius is None:
-            if right_radius is None:
-                avg_radius = None
-            else:
-                avg_radius = right_radius
-        else:
-            if left_radius is None:
-                avg_radius = left_radius
+            if self.sim:
+                source_points = np.float32([[101,140], [width-101,140], [-200,height], [width+200,height]])
+                destination_points = np.float32([[0,0], [800,0], [0,450],[800, 450]])
             else:
-                avg_radius = (left_radius+right_radius)/2
-        return avg_radius
+                source_points = np.float32([[0,0], [width,0], [-850,height], [width+850,height]])
+                destination_points = np.float32([[0,0], [500,0], [0,600],[500, 600]])
+
+            warped_img_size = (800, 450)
+            self.road_projectors[shape] = RoadGridProjector(source_points, destination_points, warped_img_size)
 
+        return self.road_projectors[shape]
 
 
     def second_process(self, image):
         """
-            This takes the camera's image, warps it to make it a birdseye view, then extracts the lane to estimate a road lane occup grid.
+            This takes the camera's image, warps the lane masks to make them a birdseye view, then extracts the lane to estimate a road lane occup grid.
+            The road between the fitted lanes is rasterized directly at the resolution of the grid.
         """
-        height, width, _ = image.shape
-
-        if self.sim:
-            source_points = np.float32([[101,140], [width-101,140], [-200,height], [width+200,height]])
-            destination_points = np.float32([[0,0], [800,0], [0,450],[800, 450]])
-        else:
-            source_points = np.float32([[0,0], [width,0], [-850,height], [width+850,height]])
-            destination_points = np.float32([[0,0], [500,0], [0,600],[500, 600]])
+        projector = self.road_projector(image.shape)
+        scale = projector.fit_scale
 
-        warped_img_size = (800, 450)
-        warped_img = self.warp(image, source_points, destination_points, warped_img_size)  
+        left, right = self.preprocessing(image)
+        left = projector.warp(left)
+        right = projector.warp(right)
 
-        left, right = self.preprocessing(warped_img)
-    
-        kernel = np.ones((41,41), np.uint8)
+        kernel = np.ones((int(41*scale) | 1, int(41*scale) | 1), np.uint8)
         opening_left = cv.morphologyEx(left, cv.MORPH_CLOSE, kernel)
         opening_right = cv.morphologyEx(right, cv.MORPH_CLOSE, kernel)
 
-
-        warped_img_shape = (warped_img.shape)
-
-        left_fit, _ = self.fitCurve(opening_left, lane="left")
-        _, right_fit = self.fitCurve(opening_right, lane="right")
+        left_fit = self.lane_trackers['left'].update(opening_left, scale)
+        right_fit = self.lane_trackers['right'].update(opening_right, scale)
+        rospy.loginfo_throttle(10, "Lane trackers: " + ", ".join(lane + " " + tracker.stats() for lane, tracker in self.lane_trackers.items()))
 
         if left_fit is None and right_fit is None:
-            print("no fit")
+            rospy.loginfo_throttle(5, "No lane fit")
             return
 
-        pts_left, pts_right = self.findPoints(warped_img_shape, left_fit, right_fit)
-
-
-        fill_curves = self.fillCurves(warped_img_shape, pts_left, pts_right)
-
-        unwarped_fill_curves = self.unwarp(fill_curves, source_points, destination_points, (width, height))
-        window1 = cv.addWeighted(image, 1, unwarped_fill_curves, 1, 0)
-
-
-        # self.avg_radius = self.radiusOfCurvature(warped_img, left_fit, right_fit)
-        # print("RADIUS", self.avg_radius)
-
-        road = self.warp(window1, source_points, destination_points, warped_img_size)
-
-        # image_message = self.bridge.cv2_to_imgmsg(road, "passthrough")
-        # self.image_pub.publish(image_message)
-
-        road_mask1 = cv.inRange(road, np.array([240,240,240]), np.array([255,255,255]))
-        road_mask2 = cv.inRange(road, np.array([0,240,240]), np.array([30,255,255]))
-        road_mask3 = cv.inRange(road, np.array([240,0,240]), np.array([255,30,255]))
+        LANE_WIDTH_PIXELS = 610 * scale #Lane width on the birdseye view, at the fitting resolution
 
-        road_mask = road_mask1 + road_mask2 + road_mask3
-
-        road = cv.bitwise_and(road, road, mask=road_mask)
+        if right_fit is None:
+            right_fit = self.estimate_missing_lane(left_fit, 'left', LANE_WIDTH_PIXELS)
+        elif left_fit is None:
+            left_fit = self.estimate_missing_lane(right_fit, 'right', LANE_WIDTH_PIXELS)
 
-        road = cv.GaussianBlur(road,(11,11),0)
-        road = cv.resize(road, (40,22))
+        # The road is between the lanes, and the lanes themselves.
+        road = projector.road_between(left_fit, right_fit) | projector.to_grid(left) | projector.to_grid(right)
 
         #Because the camera doesn't see directly in front, we just tile the bottom to fill in the gap.
-        last_row = road[-1,:,:]
-        tiled = np.tile(last_row[np.newaxis, :, :], (6,1,1))
-        road = np.vstack((road, tiled))
+        road = projector.fill_bottom(road)
 
-    
-        road = cv.cvtColor(road, cv.COLOR_BGR2GRAY)
-        _,road = cv.threshold(road,40,255,cv.THRESH_BINARY)
-
-            
-        kernel = np.ones(shape=[2, 2])
-        self.occupancy_grid2 = signal.convolve2d(
-            road.astype("int"), kernel.astype("int"), boundary="symm", mode="same"
-        )
-        self.occupancy_grid2 = np.clip(self.occupancy_grid2, 0, 50)
+        self.occupancy_grid2 = np.where(dilate(road, square(2)), 50, 0) #Grow the road lines by one cell
 
 
         #We merge the road lane occup grid with the obstacle occup grid to have a complete one.
         self.merge_occup_grids()     
-        pass
 
 
     def merge_occup_grids(self):
+
+        if self.occupancy_grid is None:
+            return
         
-        lidar_occup = np.copy(self.occupancy_grid)
-        lidar_occup = np.transpose(np.rot90(lidar_occup, k=2, axes=(1,0)))
-        lidar_occup = signal.medfilt2d(lidar_occup, 3) #Noise reduction
+        lidar_occup = median(self.occupancy_grid, 3) #Noise reduction (uint8, see projet.Morphology)
 
         if self.sim:
             if self.step <= 2:
@@ -989,19 +971,21 @@ class TurtleController:
 
     def publish_occupancy_grid(self):
         """
-        Publish populated occupancy grid to ros topic
+        Publish populated occupancy grid to ros topic (visualisation only, if someone listens)
         """
-        if not self.occupancy_grid_pub.get_num_connections():
+        if not self.debug_grid.wanted():
             return
+        self.debug_grid.submit(self.grid_message, np.copy(self.occupancy_grid2), rospy.Time.now())
+
+    def grid_message(self, grid, stamp):
+        """
+            Debug thread: occupancy grid message.
+        """
         oc = OccupancyGrid()
         oc.header.frame_id = "base_footprint"
-        oc.header.stamp = rospy.Time.now()
-        oc.info.origin.position.y -= (((self.occupancy_grid2.shape[1] / 2)) / self.CELLS_PER_METER)
-        oc.info.width = self.occupancy_grid2.shape[0]
-        oc.info.height = self.occupancy_grid2.shape[1]
-        oc.info.resolution = 1 / self.CELLS_PER_METER
-        oc.data = np.fliplr(np.rot90(self.occupancy_grid2, k=1)).flatten().tolist()
-        self.occupancy_grid_pub.publish(oc)
+        oc.header.stamp = stamp
+        fill_grid_msg(oc, grid, self.CELLS_PER_METER)
+        return oc
         
 
     def process_image(self, image):
@@ -1009,113 +993,31 @@ class TurtleController:
             Find left and right lanes from image.
         """
 
-        self.image = np.copy(image)
+        self.image = image #Read-only, the debug overlay draws on its own copy
 
         if self.step <= 4: #For the last challenge, we don't want to do this as it will be useless
 
-            # Convert image to HSV colour space
-            hsv = cv.cvtColor(image, cv.COLOR_BGR2HSV)
-            rectangle = np.copy(hsv)
-
-            if self.sim:
-                rectangle[:170, :, :] = 0
-                rectangle[220:, :, :] = 0
-            else:
-                pass
-                # rectangle[:250, :, :] = 0
-                # rectangle[:, :40, :] = 0 
-                # rectangle[:, 280:, :] = 0
-
-
-
-            # Left lane
-            lower_left = np.array([self.left_H_l, self.left_S_l, self.left_V_l])
-            upper_left = np.array([self.left_H_u, self.left_S_u, self.left_V_u])
-
-            # Right lane
-            lower_right = np.array([self.right_H_l, self.right_S_l, self.right_V_l])
-            upper_right = np.array([self.right_H_u, self.right_S_u, self.right_V_u])
-
-            # Step line
-            lower_stepline1 = np.array([self.stepline1_H_l, self.stepline1_S_l, self.stepline1_V_l])
-            upper_stepline1 = np.array([self.stepline1_H_u, self.stepline1_S_u, self.stepline1_V_u])
-            lower_stepline2 = np.array([self.stepline2_H_l, self.stepline2_S_l, self.stepline2_V_l])
-            upper_stepline2 = np.array([self.stepline2_H_u, self.stepline2_S_u, self.stepline2_V_u])
-
-
-            # Create masks for left, right and stepline colours
-            mask_left = cv.inRange(rectangle, lower_left, upper_left)
-
-            if not self.sim:
-                rectangle[:350, : : ] = 0
-        
-
-            mask_right = cv.inRange(rectangle, lower_right, upper_right)
-
-
-
-            kernel = np.ones((15,15), np.uint8) 
-            mask_left = cv.morphologyEx(mask_left, cv.MORPH_CLOSE, kernel) #fill in mask
-            mask_right = cv.morphologyEx(mask_right, cv.MORPH_CLOSE, kernel) 
-
-            rectangle = np.copy(hsv)
-            if not self.sim:
-                pass
-                # rectangle[:150, : : ] = 0
-            else:
-                rectangle[:200, :, :] = 0
-                # rectangle[:, :60, :] = 0
-                # rectangle[:, 280:, :] = 0
-
-            mask_stepline1 = cv.inRange(rectangle, lower_stepline1, upper_stepline1)
-            mask_stepline2 = cv.inRange(rectangle, lower_stepline2, upper_stepline2)
-            mask_stepline_inter = cv.bitwise_or(mask_stepline1, mask_stepline2)
-
-            #Fill in mask
-            mask_stepline_inter = cv.morphologyEx(mask_stepline_inter, cv.MORPH_CLOSE, kernel)
-
+            # Blobs of the left, right and stepline colours, each one only on its region of interest
+            # Blobs are given in frame coordinates (offset of the region of interest added back)
+            blobs = self.perceive("vision", lane_blobs, image, self.colour_classifier, self.vision_rois, ('left', 'right', 'stepline'), self.vision_kernel)
 
 
             # In the real world, the right lane is red, so we use the red colour (with the two ranges). 
             # It's easier to just switch stepline and right than to change everything. 
 
             if self.sim:
-                masked_left = cv.bitwise_and(image, rectangle, mask=mask_left)
-                masked_right = cv.bitwise_and(image, rectangle, mask=mask_right)
+                left_name, right_name, stepline_name = 'left', 'right', 'stepline'
             else:
-                masked_left = cv.bitwise_and(image, rectangle, mask=mask_left)
-                masked_right = cv.bitwise_and(image, rectangle, mask=mask_stepline_inter)
-
-            
-            # Combine masked images        
-            masked_frame = masked_left + masked_right
+                left_name, right_name, stepline_name = 'left', 'stepline', 'right'
 
 
 
 
             ## STEPLINE DETECTION
 
+            stepline_blobs = blobs[stepline_name]
 
-            if self.sim:
-                stepline_contour, _ = cv.findContours(mask_stepline_inter, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-                masked_stepline = cv.bitwise_and(image, rectangle, mask=mask_stepline_inter)
-            else:
-                stepline_contour, _ = cv.findContours(mask_right, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-                masked_stepline = cv.bitwise_and(image, rectangle, mask=mask_right)
-
-            
-            if len(stepline_contour) > 0:
-                largest_contour = max(stepline_contour, key=cv.contourArea)
-                cv.drawContours(self.image, [largest_contour], -1, (0, 255, 0), 3)
-
-            #Find biggest contour 
-            area = 0
-            for i in stepline_contour:
-                stepline_area = cv.contourArea(i)
-                if stepline_area>area:
-                    area = stepline_area
-            
-            stepline_area = area
+            stepline_area = stepline_blobs.max_area()
 
             lower = self.stepline_lower_area
             upper = self.stepline_upper_area
@@ -1145,252 +1047,140 @@ class TurtleController:
 
             ## LANE FOLLOWING
 
-            if self.sim:
-                contours_left, _ = cv.findContours(mask_left, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-                contours_right, _ = cv.findContours(mask_right, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-            else:
-                contours_left, _ = cv.findContours(mask_left, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-                contours_right, _ = cv.findContours(mask_stepline_inter, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-
-            left_lane, right_lane = None,None
-            # Find the largest contour based on area
-            if len(contours_left)>0:
-                left_lane = max(contours_left, key=cv.contourArea)
-                cv.drawContours(self.image, [left_lane], -1, (0, 255, 0), 3)
-            if len(contours_right)>0:
-                right_lane = max(contours_right, key=cv.contourArea)
-                cv.drawContours(self.image, [right_lane], -1, (255, 255, 0), 3)
-
-
-            # Calculate the centroid of the largest contour
-            if not self.left_lane is None:
-                M = cv.moments(left_lane)
-            if M["m00"] != 0:
-                self.left_lane[1] = int(M["m10"] / M["m00"])
-                self.left_lane[0] = int(M["m01"] / M["m00"])
-            else:
+            left_blobs = blobs[left_name]
+            right_blobs = blobs[right_name]
+
+            # Find the largest blob based on area, and take its centroid
+            left_lane = left_blobs.largest()
+            if left_lane is None:
                 self.left_lane = [np.nan, np.nan]
-            # Calculate the centroid of the largest contour
-            if not self.right_lane is None:
-                M = cv.moments(right_lane)
-            if M["m00"] != 0:
-                self.right_lane[1] = int(M["m10"] / M["m00"])
-                self.right_lane[0] = int(M["m01"] / M["m00"])
             else:
-                self.right_lane = [np.nan, np.nan]
-
-
-            center_left = tuple([self.left_lane[1], self.left_lane[0]])
-            center_right = tuple([self.right_lane[1], self.right_lane[0]])
+                self.left_lane = [int(left_blobs.centroids[left_lane, 1]), int(left_blobs.centroids[left_lane, 0])]
 
-            radius = 10 
-            colour = (0, 255, 0)  # Green 
-            colour2 = (255, 255, 0) # Cyan
-            thickness = 2 
+            right_lane = right_blobs.largest()
+            if right_lane is None:
+                self.right_lane = [np.nan, np.nan]
+            else:
+                self.right_lane = [int(right_blobs.centroids[right_lane, 1]), int(right_blobs.centroids[right_lane, 0])]
 
-            # Draw the circle on the self.image
-            if not np.isnan(center_left[0]):
-                cv.circle(self.image, center_left, radius, colour, thickness)
-            if not np.isnan(center_right[0]):
-                cv.circle(self.image, center_right, radius, colour2, thickness)
-            # cv.circle(self.image, center_road, radius, colour2, 5)
 
-            image_message = self.bridge.cv2_to_imgmsg(self.image, "passthrough")
-            self.image_pub.publish(image_message)
+            #Debug overlay (biggest blobs and lane centroids), only if someone is watching
+            self.debug_image.submit(self.draw_lanes, image, ((stepline_blobs, (0, 255, 0)), (left_blobs, (0, 255, 0)), (right_blobs, (255, 255, 0))),
+                                    list(self.left_lane), list(self.right_lane))
 
         else:
             pass
 
 
-
-    def last_challenge(self):
+    def draw_lanes(self, image, blobs, left_lane, right_lane):
         """
-            THE BOTTLES 
+            Debug thread: draw the biggest blobs and the lane centroids on a copy of the frame.
         """
+        image = np.copy(image)
 
-        if self.occupancy_grid is None:
-            rospy.logwarn("No occup grid")
-            return
-        
-
-        lidar_occup = np.copy(self.occupancy_grid.filled(0)) #Masked array so we fill
-        lidar_occup = np.transpose(np.rot90(lidar_occup, k=2, axes=(1,0)))
-        lidar_occup = signal.medfilt2d(lidar_occup, 3) #Noise reduction
-
-
-        
-        self.occupancy_grid2 = np.zeros((lidar_occup.shape[0], lidar_occup.shape[1], 3), dtype=np.uint8)
-        self.occupancy_grid2 = cv.cvtColor(self.occupancy_grid2, cv.COLOR_BGR2GRAY)
-        self.pathplanner.set_occugrid(self.occupancy_grid2)
-        #We set the image to a full zero because we don't have the real occugrid yet but we use the shape for some calcs
-
-
-
+        for stage_blobs, colour in blobs:
+            if len(stage_blobs) > 0:
+                stage_blobs.draw(image, stage_blobs.largest(), colour)
 
-        ## BOTTLE DETECTION
-
-
-        OccuGrid2 = (np.argwhere(lidar_occup == 100))
-        #Args where there's an obstacle
+        radius = 10 
+        thickness = 2 
 
-        if OccuGrid2.shape[0]: 
-            
-            #DB SCAN TO CLUSTER BOTTLE SHAPED OBSTACLES TOGETHER
-            clustering = DBSCAN(eps=3, min_samples=10).fit(OccuGrid2)
-            
-            labels = clustering.labels_
-            n_clusters_ = len(set(labels)) - (1 if -1 in labels else 0)
-            # print("clusters ", n_clusters_)
+        # Green, Cyan
+        for lane, colour in ((left_lane, (0, 255, 0)), (right_lane, (255, 255, 0))):
+            if not np.isnan(lane[0]):
+                cv.circle(image, (lane[1], lane[0]), radius, colour, thickness)
 
-            unique_labels = set(labels)
-            core_samples_mask = np.zeros_like(labels, dtype=bool)
-            core_samples_mask[clustering.core_sample_indices_] = True
-
-            colours = [plt.cm.Spectral(each) for each in np.linspace(0, 1, len(unique_labels))]
-            for k, col in zip(unique_labels, colours):
-                # if k == -1:
-                #     # Black used for noise.
-                #     col = [0, 0, 0, 1]
-
-                class_member_mask = labels == k
-                xy = OccuGrid2[class_member_mask & core_samples_mask]
-
-                # print("LEN XY", len(xy))
-                
-                #If we have toooooo many samples, it's probably not a bottle.
+        return image
 
-                if len(xy)>0 and len(xy)<30:
-                    x = round(np.mean(xy[:,0]))
-                    y = round(np.mean(xy[:,1]))    
 
-                    x, y = self.turtle_to_odom((x,y))
-
-                    matched = False
-
-                    #This is basically a poor man's Kalman Filter. We estimate the bottles position based on the odometry of the robot, 
-                    #and if a detected bottle is close enough to that position, we consider them to be the same bottle.
-                    for i in self.bottles:
-                        x2, y2 = i.get_position()
-                        distance = math.sqrt((x2 - x)**2 + (y2 - y)**2)
-                        if abs(distance) < self.same_bottle_threshold:
-                            # print(f"matched with an existing bottle, distance: {distance}, pos : {x,y}")
-                            i.set_position((x,y))
-                            if not i.get_gate() is None:
-                                
-                                # We update the gate with the new detected position for the bottle.
-                                # This recomputes gate center and stuff.
-                                self.gates[i.get_gate()].update(self.bottles)
-                            matched = True
-                            break
-                        else:
-                            continue
-                    if not matched and not self.confirmed:
-                        # print("new bottle discovered!", (x,y),)
-                        
-                        # we don't add new bottles if we already have 3 gates (ie self.confirmed = True)
-                        self.bottles.append(Bottle(len(self.bottles), (x,y)))
-
-                    # cv.circle(self.occupancy_grid2, [x,y], 4, (0,255,255), 4)
-
-
-
-
-
-        ## GATE DETECTION
-
-        potential_neighbors = {} #A bottle can have multiple potential neighbors
-        neighbors = [] #Neighbors
-        res_neighbors = {} #"Reserved neighbors"
 
+    def perceive(self, stage, function, array, *args):
+        """
+            Run a perception stage (projet.Perception) in the worker processes, or inline if there are none.
+        """
+        if self.perception is None:
+            return function(array, *args)
+        return self.perception.run(stage, function, array, *args)
 
-    
-        target_distance = self.bottles_target_distance #Target gate width
-        tolerance = self.bottles_tolerance #Tolerance to that target gate width
 
-        if not self.confirmed: # If we already found the 3 gates we want, we don't bother
 
-            # STEP 1: FIND ALL THE BOTTLES THAT ARE WITHIN A CERTAIN RANGE OF EACH OTHER.
+    def last_challenge_graph(self):
+        """
+            The stages of the last challenge, and what they depend on (see projet.StageGraph).
+            A stage only runs when one of its inputs changed since it last ran.
+        """
+        graph = StageGraph()
 
-            for i in range(len(self.bottles)):
-                potential_neighbors[i] = []
-                for j in range(len(self.bottles)):
-                        if i==j:
-                            continue
-                        x1, y1 = self.bottles[i].get_position()
-                        x2, y2 = self.bottles[j].get_position()
-                        distance = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-                        # print("DISTANCE BETWEEN BOTTLES ", distance)
-                        if abs(distance - target_distance) < tolerance:
-                            potential_neighbors[i].append(j) #The two bottles could be part of the same gate.
+        graph.source("grid", lambda: self.grid_version) #LiDAR grid content
+        graph.source("image", lambda: self.image_rect_stamp) #Last rectified image
+        graph.source("odom", lambda: self.odom_stamp) #Last pose
+        graph.source("bottle_set", lambda: self.bottles.version) #Bottles added or moved
+        graph.source("target", lambda: (self.state, self.found_colours, self.current_index, self.transited_gates))
 
+        graph.stage("bottles", self.detect_bottles, ("grid",)) #Each grid is only given once to the tracker
+        graph.stage("gates", self.find_gates, ("bottle_set",))
+        graph.stage("overlay", self.draw_gates_overlay, ("gates", "odom", "target"))
+        graph.stage("merge", self.merge_gates_grid, ("grid", "overlay"))
+        graph.stage("blobs", self.gate_blobs, ("image",)) #The colour masks, only for a new frame
+        graph.stage("colours", self.gate_colours, ("blobs", "odom", "gates"))
+        graph.stage("plan", self.choose_goal, ("merge", "odom", "colours", "target"))
+        return graph
 
-            # STEP 2: TRY AND ASSIGN THE BOTTLES TOGETHER
 
-            """
-                IMAGINE THIS:
-                    A -- B   C -- D
+    def last_challenge(self):
+        """
+            THE BOTTLES 
+        """
 
-                    where AB and CD are gates, but B and C are also the right distance apart to be considered potential neighbors.
+        if self.occupancy_grid is None:
+            rospy.logwarn("No occup grid")
+            return
 
-                For bottle A, we check it's potential neighbor B.
+        self.last_challenge_stages.run()
+        rospy.loginfo_throttle(10, "Last challenge stages: " + self.last_challenge_stages.stats())
 
-                A only has one potential neighbor, B. 
 
-                If B only had one potential neighbor, and that potential neighbor was A, then B and A are a gate.
+    def detect_bottles(self):
 
-                However, B has multiple potential neighbors. (A and C).
+        lidar_occup = self.occupancy_grid.filled(0) #Masked array so we fill
 
-                Because A only has B, A becomes B's "reserved neighbor". 
 
-                Going through the bottles, we get the same thing for D and C, where D is C's reserved neighbor.
-                
-                So we end up with:
+        ## BOTTLE DETECTION
 
-                potential neighbors: {A: B; B: A,C; C: B, D; D:C}
-                reserved neighbors: {B: A, C:D}
 
-            """
+        #Bottle shaped clusters of obstacles (noise reduction + clustering, see projet.Perception), as grid cells
+        clusters = self.perceive("bottles", bottle_clusters, lidar_occup, 3, 10, 30, self.IS_OCCUPIED, self.bottles_clustering)
+        detections = self.turtle_to_odom(np.array(clusters).reshape(-1, 2))
 
+        #Each detection is assigned (globally) to the closest known bottle within same_bottle_threshold, and the
+        #matched bottles positions are Kalman filtered (see projet.BottleTracker).
+        self.bottle_tracker.gate = self.same_bottle_threshold
+        _, matched, unmatched = self.bottle_tracker.update(detections)
 
-            for i in potential_neighbors:   
-                if len(potential_neighbors[i]) == 1: # Only one potential neighbor: 
-                    if len(potential_neighbors[potential_neighbors[i][0]]) == 1: 
-                        #If the other bottle also only has one potential neighbor,
-                        #We know that they can only be together
-                        if potential_neighbors[potential_neighbors[i][0]][0] == i:
-                            #If both neighbors only have each other as potential neighbors, pair them up. 
-                            # print(f"Neighbors found: {i}, {potential_neighbors[i]}")
-                            if not any(i in gate for gate in neighbors): 
+        # The gates of the moved bottles recompute their center and stuff when they are next used.
+        self.bottles.set_positions(matched, self.bottle_tracker.x[matched])
 
-                                # If we haven't already assigned them (B with A then A with B is the same gate)
-                                neighbors.append((i, potential_neighbors[i][0]))
-                    else: 
-                        #The other bottle is "ambiguous". But because bottle i only has one potential neighbor, it becomes a reserved neighbor of the other bottle.
-                        try:
-                            res_neighbors[potential_neighbors[i][0]].append(i)
-                        except:
-                            res_neighbors[potential_neighbors[i][0]] = [i]
+        # we don't add new bottles if we already have 3 gates (ie self.confirmed = True)
+        # (nor a second detection of a bottle we already have, see BottleTracker.new_detections)
+        if not self.confirmed:
+            for d in self.bottle_tracker.new_detections(detections, unmatched):
+                # print("new bottle discovered!", detections[d])
+                self.bottles.add(detections[d])
+                self.bottle_tracker.add(detections[d])
 
 
-            """
-                continuing, we see that B only has one reserved neighbor. As such, B must be with A, otherwise A would not have any neighbors.
+    def find_gates(self):
 
-                This also means C and D are together. 
+        ## GATE DETECTION
 
-                We end up with A--B and C--D, which is the correct pairing. 
+        if not self.confirmed: # If we already found the 3 gates we want, we don't bother
 
-                If we only had three bottles: A -- B -- C, we couldn't know which pair is the correct one.
-            
-            """
+            # Pair up the bottles that are the gate width apart (target distance +- tolerance).
+            # This is a maximum weight matching: as many gates as possible, the best fitting ones (see projet.GatePairing).
+            # It is only recomputed when a bottle is added or moved.
 
-            for i in res_neighbors:
-                if len(res_neighbors[i])==1:
-                    neighbors.append((i, res_neighbors[i][0]))
-                else:
-                    pass
-                    # print(f"ambiguity for {i}")
+            neighbors = self.gate_pairing.pairs(self.bottles.get_positions())
 
-            
 
             """
                 Now that we have our neighbors, we asssign them to gates.
@@ -1403,22 +1193,13 @@ class TurtleController:
                 else:
                     if self.bottles[i[0]].get_gate() == self.bottles[i[1]].get_gate():
                         continue
-                c1 = self.bottles[i[0]].get_position()
-                c2 = self.bottles[i[1]].get_position()
-
-                cX = np.mean([c1[0],c2[0]])
-                cY = np.mean([c1[1],c2[1]])
-
- 
                 self.bottles[i[0]].set_gate(len(self.gates))
                 self.bottles[i[1]].set_gate(len(self.gates))
 
-                self.gates.append(Gate(center_position=(cX,cY), bottle_index1=self.bottles[i[0]].get_index(), bottle_index2=self.bottles[i[1]].get_index()))
+                self.gates.add(self.bottles[i[0]].get_index(), self.bottles[i[1]].get_index())
                 # cv.circle(self.occupancy_grid2, [cX,cY], 2, (0,255,0), 3)
         
 
-        nb = {} #This is the number of bottles that are currently assigned to this gate. 
-
         """
             During a normal detection phase, it can happen that obstructions prevent us from seeing all the bottles, and we thus end up with an erroneous pairing.
 
@@ -1427,45 +1208,14 @@ class TurtleController:
             Because a lot of the IDs of gates and bottles are just their index, it is best to keep them in the lists.
         """
 
-        for g in range(0,len(self.gates)):
-            nb[g] = 0 #Number of bottles assigned to each gate
-
-
-        for i in self.bottles:
-            if not i.get_gate() is None:
-                try:    
-                    nb[i.get_gate()] += 1 #the gate "i.get_gate()" has one additional bottle that is assigned to it.
+        bottle_gates = self.bottles.gate[:len(self.bottles)]
+        assigned = bottle_gates[bottle_gates >= 0]
 
-                    if self.gates[i.get_gate()].get_colour() == self.order[self.current_index] and self.found_colours:
-
-                        # If the gate is the color we want to go through, we don't do anything
-                        pass
-                        # print("Opened target gate")
-                    else:
-
-                        # If the gate is not the one we want to go through, we draw a line between the bottles to "close it"
-                        b1,b2 = self.gates[i.get_gate()].get_bottles_indices()
-
-                        # "closing" a gate is just drawing a line between the bottles on the occupancy grid, which makes it look like an obstacle.
-                        cells = list(self.traverse_grid(self.odom_to_grid(self.bottles[b1].get_position()), self.odom_to_grid(self.bottles[b2].get_position())))
-                        
-                        for c in cells:
-                            try:
-                                self.occupancy_grid2[c[0],c[1]] = 127
-                            except:
-                                continue
-                except:
-                    pass
-            try:
-                pos = self.odom_to_grid(i.get_position())
-                self.occupancy_grid2[pos[0],pos[1]] = 100 #We add the bottles to the occupancy grid (it might not be seen by the LiDAR, but it still has to be shown)
-            except:
-                pass
-        
+        nb = np.bincount(assigned, minlength=len(self.gates)) #This is the number of bottles that are currently assigned to each gate.
 
         #Active gates are gates which have two bottles currently assigned to them. 
 
-        self.active_gates = [key for key, value in nb.items() if value == 2]
+        self.active_gates = np.flatnonzero(nb == 2).tolist()
 
         #If we have three active gates, we have found all the gates we want and can thus lock those in.
         if len(self.active_gates) == 3 and not self.confirmed:
@@ -1477,154 +1227,124 @@ class TurtleController:
         # print("Active gates ", len(self.active_gates))
         # print("nb bottles: ", len(self.bottles))
 
+
+    def draw_gates_overlay(self):
+        """
+            The bottles and the closed gates on an empty grid, the LiDAR grid is merged in after.
+        """
+
+        bottle_gates = self.bottles.gate[:len(self.bottles)]
+        assigned = bottle_gates[bottle_gates >= 0]
+
+        # "closing" a gate is just drawing a line between the bottles on the occupancy grid, which makes it look like an obstacle.
+        # The gate we want to go through stays open. The lines are kept in the odom frame until the gate moves (see projet.GridOverlay).
+        self.gates.refresh()
+        closures = []
+        for g in np.unique(assigned):
+            if self.found_colours and self.gates[g].get_colour() == self.order[self.current_index]:
+                continue
+            b1, b2 = self.gates[g].get_bottles_indices()
+            closures.append(self.overlay.closure(int(g), self.gates.version[g], self.bottles.positions[b1], self.bottles.positions[b2]))
+
+        #We add the bottles to the occupancy grid on top of the closed gates (they might not be seen by the LiDAR, but they still have to be shown)
+        self.overlay_grid = np.zeros(self.occupancy_grid.shape[:2], dtype=np.uint8)
+        self.overlay.composite(self.overlay_grid, self.frames(), [(points, 127) for points in closures] + [(self.bottles.get_positions(), 100)])
+
+
+    def merge_gates_grid(self):
+        self.occupancy_grid2 = self.overlay_grid #Not modified by the merge
         self.merge_occup_grids()
-        self.gate_colours()
-        pass
 
 
         
-    def gate_colours(self):
+    def gate_blobs(self):
         """
-            This assigns colours to the gates we have, and decides which point we should go to.
+            This finds the gates the camera sees (bearings of the bottles of each colour).
         """
 
-        goal_point = None
-
-
         ## MASKING COLOURS
 
 
-        self.image_rect = np.copy(self.cv_image_rect)
+        self.image_rect = self.cv_image_rect #Read-only, the debug overlay draws on its own copy
+        self.camera_gates = []
 
+        # One pass for the three colours
         try:
-            hsv = cv.cvtColor(self.cv_image_rect, cv.COLOR_BGR2HSV)
+            blobs = self.perceive("gates", colour_blobs, self.cv_image_rect, self.colour_classifier, ('blue', 'green', 'yellow'))
         except:
             print("ERROR WITH THE HSV?")
             return
 
-        # Blue lane
-        BlueBottle_l = np.array([self.blue_H_l, self.blue_S_l, self.blue_V_l])
-        BlueBottle_u = np.array([self.blue_H_u, self.blue_S_u, self.blue_V_u])
+        # threshold = (6000, 200)[self.sim]
+        threshold = self.bottles_area_threshold #Minimum blob area for it to be a bottle.
 
-		# Green lane
-        GreenBottle_l = np.array([self.green_H_l, self.green_S_l, self.green_V_l])
-        GreenBottle_u = np.array([self.green_H_u, self.green_S_u, self.green_V_u])
 
+        #For each blob, if it is above the threshold, we consider it to be a bottle of that color
 
-        yellowBottle_l = np.array([self.yellow_H_l, self.yellow_S_l, self.yellow_V_l])
-        yellowBottle_u = np.array([self.yellow_H_u, self.yellow_S_u, self.yellow_V_u])
-        mask_yellow = cv.inRange(hsv, yellowBottle_l, yellowBottle_u)
+        overlay = []
+        camera_gates = [] #(colour, lowest bearing, highest bearing) of the gates the camera sees, 0 blue, 1 green, 2 yellow
+        width = self.image_rect.shape[1]
+        for key, (colour, draw_colour) in enumerate((('blue', (255, 20, 20)), ('green', (20, 255, 20)), ('yellow', (20, 20, 255)))):
+            keep = blobs[colour].select(min_area=threshold)
+            overlay.append((blobs[colour], keep, draw_colour))
 
-        mask_blue = cv.inRange(hsv, BlueBottle_l, BlueBottle_u)
-        mask_green = cv.inRange(hsv, GreenBottle_l, GreenBottle_u)
+            if len(keep) == 2 and not self.camera is None: #we are seeing the two bottles of that gate.
+                boxes = blobs[colour].bboxes[keep]
+                low, high = self.camera.column_bearings([(boxes[:, 0] + boxes[:, 2]).max() - 1, boxes[:, 0].min()], width) #Rightmost column is the lowest bearing
+                camera_gates.append((key, low, high))
 
-    
+        self.camera_gates = camera_gates
 
-        contours_blue, _ = cv.findContours(mask_blue, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-        contours_green, _ = cv.findContours(mask_green, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-        contours_yellow, _ = cv.findContours(mask_yellow, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
+        #Debug overlay (bottle blobs), only if someone is watching
+        self.debug_image.submit(self.draw_bottles, self.image_rect, overlay)
 
 
-        # threshold = (6000, 200)[self.sim]
-        threshold = self.bottles_area_threshold #Minimum contour area for it to be a bottle.
-
-        yellow_bottles = []
-        green_bottles = []
-        blue_bottles = []       
-
-
-        #For each contour, if it is above the threshold, we consider it to be a bottle of that color
-
-        for i in contours_blue:
-            if cv.contourArea(i) > threshold:
-                # print("contour blue area: ", cv.contourArea(i))
-                M = cv.moments(i)
-                if M["m00"] != 0:
-                    y = int(M["m10"] / M["m00"])
-                    x = int(M["m01"] / M["m00"])
-                    blue_bottles.append([x,y, cv.contourArea(i)])
-                cv.drawContours(self.image_rect, [i], -1, (255, 20, 20), 3)
-
-        for i in contours_green:
-            if cv.contourArea(i) > threshold:
-                # print("contour green area: ", cv.contourArea(i))
-                M = cv.moments(i)
-                if M["m00"] != 0:
-                    y = int(M["m10"] / M["m00"])
-                    x = int(M["m01"] / M["m00"])
-                    green_bottles.append([x,y, cv.contourArea(i)])
-                cv.drawContours(self.image_rect, [i], -1, (20, 255, 20), 3)
-
-        for i in contours_yellow:
-            if cv.contourArea(i) > threshold:
-                # print("contour yellow area: ", cv.contourArea(i))
-                M = cv.moments(i)
-                if M["m00"] != 0:
-                    y = int(M["m10"] / M["m00"])
-                    x = int(M["m01"] / M["m00"])
-                    yellow_bottles.append([x,y, cv.contourArea(i)])
-                cv.drawContours(self.image_rect, [i], -1, (20, 20, 255), 3)
-
-        #0 blue, 1 green, 2 yellow
-        gates = {0:[None, None], 1:[None, None], 2:[None, None]} #Each gate has a center error and avg area
-
-        if len(yellow_bottles) == 2: #we are seeing two yellow bottles.
-            avg_area_yellow = (yellow_bottles[0][2] + yellow_bottles[1][2]) * 0.5
-            center_yellow = (yellow_bottles[0][1] + 0.5*(yellow_bottles[1][1] - yellow_bottles[0][1]))
-
-            offcenter_yellow = center_yellow - (self.image_rect.shape[1] * 0.5)
-
-            gates[2] = [offcenter_yellow, avg_area_yellow]
-        
-        if len(blue_bottles) == 2: #we are seeing two blue bottles.
-            avg_area_blue = (blue_bottles[0][2] + blue_bottles[1][2]) * 0.5
-            center_blue = (blue_bottles[0][1] + 0.5*(blue_bottles[1][1] - blue_bottles[0][1]))
+    def gate_colours(self):
+        """
+            This assigns colours to the gates we have.
+        """
 
-            offcenter_blue = center_blue - (self.image_rect.shape[1] * 0.5)
+        camera_gates = self.camera_gates
 
-            gates[0] = [offcenter_blue, avg_area_blue]
-        
-        if len(green_bottles) == 2: #we are seeing two green bottles.
-            avg_area_green = (green_bottles[0][2] + green_bottles[1][2]) * 0.5
-            center_green = (green_bottles[0][1] + 0.5*(green_bottles[1][1] - green_bottles[0][1]))
+        """
+            We look through all the active gates (the ones with 2 bottles assigned to them) that have no colour yet, and project their
+            bottles in the camera (see projet.CameraBearings). A gate the camera sees and a gate of the LiDAR that cover the same bearings 
+            are the same gate.
+        """
 
-            offcenter_green = center_green - (self.image_rect.shape[1] * 0.5)
+        if self.camera is None:
+            rospy.logwarn_throttle(10, "No camera calibration yet, the gates can't be coloured")
 
-            gates[1] = [offcenter_green, avg_area_green]   
+        uncoloured = [i for i in self.active_gates if self.gates[i].get_colour() is None]
 
-        
-        possible_pairing = {0: [], 1: [], 2: []} #Possible pairing of colours to gates.
+        if len(camera_gates) and len(uncoloured):
+            width = self.image_rect.shape[1]
+            gate_bottles = self.frames().odom_to_turtle(self.bottles.positions[self.gates.pairs[uncoloured].ravel()]).reshape(-1, 2)
+            bearings, distances = self.camera.point_bearings(gate_bottles)
+            _, visible = self.camera.project(gate_bottles, width)
 
+            half_width = np.arctan2(self.bottle_radius, distances) #The bottles aren't points
+            lidar_gates = np.column_stack(((bearings - half_width).reshape(-1, 2).min(axis=1), (bearings + half_width).reshape(-1, 2).max(axis=1)))
 
+            overlap = interval_overlap([gate[1:] for gate in camera_gates], lidar_gates)
+            overlap[:, ~visible.reshape(-1, 2).all(axis=1)] = 0 #Both bottles have to be in the image
 
-        """
-            We look through all the active gates (the ones with 2 bottles assigned to them) and figure out if the 
-            gate is supposed to be in front of us, as in, should it be visible on the camera.
-        
-        """
-        for i in self.active_gates:
-            if self.gates[i].get_colour() is None:
-                center = self.odom_to_grid(self.gates[i].get_center_pos())
-                local_center = (self.occupancy_grid.shape[1] - center[0], center[1] - 0.5*self.occupancy_grid.shape[0])
-                angle = math.atan2(local_center[1], local_center[0])
-                distance = math.sqrt(local_center[0]**2 + local_center[1]**2)
-                # print("distna", distance)
-                if abs(angle) < 0.3 and distance < 45:
-                    for key, value in gates.items():
-                        if value[0] is None:
-                            continue
-                        else:
-                            if abs(value[0] - angle*10) < 30: #If the gate we see (Camera) is in front, and the active gate (LiDAR) is in front too, they might be the same
-                                possible_pairing[key].append(i)
-
-        for colour, gate in possible_pairing.items():
-            if len(gate) == 1: #If there is a match (and no ambiguity)
+            for c, g in associate(overlap, self.gate_colour_min_overlap):
+                colour, gate = camera_gates[c][0], uncoloured[g]
                 rospy.logwarn(f"FOUND colour FOR GATE {gate}, colour IS {colour}")
-                self.gates[gate[0]].set_colour(colour, self.bottles) #This also sets all the bottles colours.
+                self.gates[gate].set_colour(colour, self.bottles) #This also sets all the bottles colours.
 
         # for gate in self.active_gates:
         #     print(gate, self.gates[gate].get_colour())
 
+
+    def choose_goal(self):
+        """
+            This decides which point we should go to.
+        """
+
+        goal_point = None
+
         """
             The last challenge uses a 3 state SM. 
             State 0 is when all gates and their colour have not been found .
@@ -1723,9 +1443,6 @@ class TurtleController:
                 the closest point function has a "closest=False" argument which means it returns the farthest one.
             """
             goal_point = self.closest_point(self.gates[self.target_gate].get_offset_points(), closest=False)[0]
-        
-        image_message = self.bridge.cv2_to_imgmsg(self.image_rect, "passthrough")
-        self.image_pub.publish(image_message)
 
 
         # if we have a goal
@@ -1735,19 +1452,29 @@ class TurtleController:
         
 
 
+    def draw_bottles(self, image, overlay):
+        """
+            Debug thread: draw the bottle blobs on a copy of the frame.
+        """
+        image = np.copy(image)
+        for blobs, keep, colour in overlay:
+            blobs.draw(image, keep, colour)
+        return image
+
+
+
     def closest_point(self, points, closest=True):
 
         """
             return closest (or fathest) point between two. (with the distance)
         """
 
-        point1 = self.odom_to_grid(points[0])
-        point2 = self.odom_to_grid(points[1])
+        cells = self.odom_to_grid(np.array(points, dtype=float).reshape(-1, 2))
+        point1, point2 = tuple(cells[0]), tuple(cells[1])
         
 
-        # local_center = (self.occupancy_grid.shape[1] - center[0], center[1] - 0.5*self.occupancy_grid.shape[0])
-        p1 = (self.occupancy_grid.shape[1] - point1[0], point1[1] - 0.5*self.occupancy_grid.shape[0])
-        p2 = (self.occupancy_grid.shape[1] - point2[0], point2[1] - 0.5*self.occupancy_grid.shape[0])
+        p1 = cell_offset(point1, self.occupancy_grid.shape)
+        p2 = cell_offset(point2, self.occupancy_grid.shape)
  
         d1 = math.sqrt(p1[0]**2 + p1[1]**2)
         d2 = math.sqrt(p2[0]**2 + p2[1]**2)
@@ -1778,9 +1505,9 @@ class TurtleController:
 
         # Often, the goal is outside the occupancy grid.
 
-        if goal[1] >= self.occupancy_grid.shape[0] or goal[0] >= self.occupancy_grid.shape[1]:
+        if goal[0] >= self.occupancy_grid.shape[0] or goal[1] >= self.occupancy_grid.shape[1]:
 
-            local_waypoint = np.array((self.occupancy_grid2.shape[0] - goal[0], goal[1] - 0.5 * self.occupancy_grid2.shape[1]))
+            local_waypoint = np.array(cell_offset(goal, self.occupancy_grid2.shape))
             heading = math.atan2(local_waypoint[1], local_waypoint[0])
             Kp = (0.75, -0.7)[self.sim]
             self.ang_vel = np.sign(heading) * Kp
@@ -1803,10 +1530,10 @@ class TurtleController:
             lidar_occup = np.copy(self.occupancy_grid2)
             occu_grid_cp = (lidar_occup > 95)
 
-            selem = disk(3)  # 'radius' should be set to half the robot's width in pixels
+            selem = disk(3)  # 'radius' should be set to half the robot's width in pixels (cached, see projet.Morphology)
 
             # Dilate the obstacle map
-            inflated_obstacles = dilation(occu_grid_cp, selem)
+            inflated_obstacles = dilate(occu_grid_cp, selem)
             inflated_obstacles = np.where(inflated_obstacles, 0, 100)
 
 
@@ -1830,7 +1557,7 @@ class TurtleController:
                 #This happens when the gate gets closed while we're still inside it, and we thus need to move out of it.
                 local_waypoint = np.array((10, 0))
             else:
-                local_waypoint = np.array((self.occupancy_grid2.shape[0] - waypoint[0], waypoint[1] - 0.5 * self.occupancy_grid2.shape[1]))
+                local_waypoint = np.array(cell_offset(waypoint, self.occupancy_grid2.shape))
 
             distance = np.linalg.norm(local_waypoint)
 
@@ -1840,7 +1567,8 @@ class TurtleController:
                 """
                     If we're transiting a gate, check our distance to the gate center to determine if we passed through.
                 """
-                if (abs(self.odom_to_grid(self.gates[self.target_gate].get_center_pos())[0] - self.occupancy_grid.shape[1] ) < 6) and (abs(self.odom_to_grid(self.gates[self.target_gate].get_center_pos())[1] - (self.occupancy_grid.shape[0] * 0.5) ) < 6):
+                center_offset = cell_offset(self.odom_to_grid(self.gates[self.target_gate].get_center_pos()), self.occupancy_grid.shape)
+                if abs(center_offset[0]) < 6 and abs(center_offset[1]) < 6:
                     rospy.logwarn("TRANSITED")
                     self.buffer = 0
                     self.transited_gates += 1
@@ -0,0 +1,67 @@
+import numpy as np
+import cv2 as cv
+
+
+
+"""
+    Blob extraction from binary masks, used for the lanes, the stepline and the bottles.
+
+    One call to cv.connectedComponentsWithStats gives the area, bounding box and
+    centroid of every blob as arrays, so selecting blobs (largest one, area
+    thresholds) is vectorized instead of looping over contours.
+
+    The areas are those of cv.contourArea (so the thresholds in the params keep
+    their meaning): for the polygon through the border pixels, Pick's theorem gives
+    pixel count - border pixels / 2 - 1. The border pixels of every blob are counted
+    with one erosion and one bincount of the labels.
+"""
+
+
+
+_CROSS = cv.getStructuringElement(cv.MORPH_CROSS, (3, 3))
+
+
+
+class Blobs:
+    def __init__(self, mask, offset=(0, 0), connectivity=8):
+        """
+            mask is a binary (0/255) 8 bit image. offset (x, y) is added to the bounding boxes and centroids,
+            to get frame coordinates when the mask is a region of interest.
+        """
+        n, labels, stats, centroids = cv.connectedComponentsWithStats(mask, connectivity=connectivity)
+
+        #Border pixels: the ones with a background pixel (or the image edge) above, below, left or right
+        border = cv.subtract(mask, cv.erode(mask, _CROSS, borderType=cv.BORDER_CONSTANT, borderValue=0))
+        border_counts = np.bincount(labels[border > 0], minlength=n)
+
+        #Label 0 is the background
+        self.pixels = stats[1:, cv.CC_STAT_AREA]
+        self.areas = np.maximum(self.pixels - 0.5 * border_counts[1:] - 1, 0.0) #Same as cv.contourArea
+        self.bboxes = stats[1:, :4] + np.array([offset[0], offset[1], 0, 0])
+        self.centroids = centroids[1:] + np.array(offset, dtype=float)
+
+    def __len__(self):
+        return len(self.areas)
+
+    def largest(self):
+        """ Index of the largest blob (None if there is none). """
+        if not len(self):
+            return None
+        return int(np.argmax(self.areas))
+
+    def max_area(self):
+        return float(self.areas.max()) if len(self) else 0.0
+
+    def select(self, min_area=None, max_area=None):
+        """ Indices of the blobs with min_area < area < max_area. """
+        keep = np.ones(len(self), dtype=bool)
+        if min_area is not None:
+            keep &= self.areas > min_area
+        if max_area is not None:
+            keep &= self.areas < max_area
+        return np.flatnonzero(keep)
+
+    def draw(self, img, indices, colour, thickness=3):
+        """ Draw the bounding boxes of some blobs (visualisation). """
+        for x, y, w, h in self.bboxes[np.atleast_1d(indices)]:
+            cv.rectangle(img, (int(x), int(y)), (int(x + w - 1), int(y + h - 1)), colour, thickness)
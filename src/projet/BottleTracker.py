@@ -0,0 +1,117 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.optimize import linear_sum_assignment
+
+
+
+"""
+    Kalman filtered tracking of the bottles (odom frame).
+
+    The bottles don't move, so each track is a constant position filter. The
+    states and covariances of all the tracks are kept in arrays. Detections are
+    associated through a KD-tree of the tracks (only the pairs within the gate are
+    considered), with one global assignment instead of taking the first bottle that
+    is close enough, and all the matched tracks are updated in one vectorized step.
+"""
+
+
+
+class BottleTracker:
+    def __init__(self, gate=0.12, process_noise=1e-5, measurement_noise=4e-4):
+        """
+            gate: max distance (m) between a detection and its track.
+            process_noise: variance (m²) added to the tracks at each update (odometry drift).
+            measurement_noise: variance (m²) of a detection, also the variance of a new track.
+        """
+        self.gate = gate
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+
+        self.x = np.zeros((0, 2)) #Positions
+        self.P = np.zeros((0, 2, 2)) #Covariances
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, position):
+        """
+            New track at this position. Returns its index.
+        """
+        self.x = np.vstack((self.x, np.asarray(position, dtype=float).reshape(1, 2)))
+        self.P = np.concatenate((self.P, (self.measurement_noise * np.eye(2))[np.newaxis]))
+        return len(self.x) - 1
+
+    def associate(self, detections):
+        """
+            Global assignment of the detections (N x 2) to the tracks within the gate.
+            Returns the matched (detection, track) indices, and the unmatched detections.
+        """
+        detections = np.asarray(detections, dtype=float).reshape(-1, 2)
+        if not len(self.x) or not len(detections):
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.arange(len(detections))
+
+        # Candidate pairs: tracks within the gate of each detection
+        candidates = cKDTree(self.x).query_ball_point(detections, self.gate)
+        rows = np.repeat(np.arange(len(detections)), [len(c) for c in candidates])
+        cols = np.fromiter((t for c in candidates for t in c), dtype=int, count=len(rows))
+
+        if not len(rows):
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.arange(len(detections))
+
+        # Only the detections and tracks that have a candidate take part in the assignment
+        det_ids, rows = np.unique(rows, return_inverse=True)
+        track_ids, cols = np.unique(cols, return_inverse=True)
+
+        outside = 1e6 #Cost of a pair outside the gate
+        cost = np.full((len(det_ids), len(track_ids)), outside)
+        cost[rows, cols] = np.linalg.norm(detections[det_ids[rows]] - self.x[track_ids[cols]], axis=1)
+
+        r, c = linear_sum_assignment(cost)
+        inside = cost[r, c] < outside
+        matched_dets, matched_tracks = det_ids[r[inside]], track_ids[c[inside]]
+
+        unmatched = np.setdiff1d(np.arange(len(detections)), matched_dets)
+        return matched_dets, matched_tracks, unmatched
+
+    def update(self, detections):
+        """
+            Predict all the tracks, associate the detections and correct the matched tracks.
+            Returns the matched (detection, track) indices, and the unmatched detections.
+        """
+        detections = np.asarray(detections, dtype=float).reshape(-1, 2)
+
+        self.P += self.process_noise * np.eye(2)
+
+        matched_dets, matched_tracks, unmatched = self.associate(detections)
+
+        if len(matched_tracks):
+            P = self.P[matched_tracks]
+            S = P + self.measurement_noise * np.eye(2)
+            K = P @ np.linalg.inv(S)
+            innovation = detections[matched_dets] - self.x[matched_tracks]
+
+            self.x[matched_tracks] += (K @ innovation[:, :, np.newaxis])[:, :, 0]
+            self.P[matched_tracks] = (np.eye(2) - K) @ P
+
+        return matched_dets, matched_tracks, unmatched
+
+    def new_detections(self, detections, unmatched):
+        """
+            The unmatched detections that can be new bottles: not within the gate of a track (two detections of
+            the same bottle, only one of them is matched) nor of a new bottle kept before them.
+        """
+        detections = np.asarray(detections, dtype=float).reshape(-1, 2)
+        unmatched = np.asarray(unmatched, dtype=int)
+        if len(self.x) and len(unmatched):
+            distances, _ = cKDTree(self.x).query(detections[unmatched])
+            unmatched = unmatched[distances > self.gate]
+
+        new = []
+        for d in unmatched:
+            if not new or np.min(np.linalg.norm(detections[new] - detections[d], axis=1)) > self.gate:
+                new.append(int(d))
+        return np.array(new, dtype=int)
+
+    def reset(self):
+        self.x = np.zeros((0, 2))
+        self.P = np.zeros((0, 2, 2))
@@ -0,0 +1,115 @@
+import numpy as np
+import yaml
+from scipy.optimize import linear_sum_assignment
+
+
+
+"""
+    Calibrated bearings of the rectified camera image.
+
+    The rectified image (image_proc) is a pinhole camera of projection matrix P,
+    so a column u looks along the bearing atan((cx - u) / fx) in the turtle frame
+    (x forward, y left, the bearing is positive on the left). The bearing of every
+    column is kept in a table (per image width, for reduced images), and points of
+    the turtle frame are projected to image columns all at once.
+
+    The gates seen by the camera and the gates of the LiDAR are then associated by
+    the overlap of the bearings they cover, with one global assignment.
+
+    The intrinsics come from the calibration yaml (calib/raspicam.yaml) or from a
+    CameraInfo message.
+"""
+
+
+
+class CameraBearings:
+    def __init__(self, fx, cx, width, x_offset=0.0):
+        """
+            fx, cx: focal length and principal point (pixels) for an image of this width.
+            x_offset: how far (m) in front of the turtle frame origin (the LiDAR) the camera is.
+        """
+        self.fx = float(fx)
+        self.cx = float(cx)
+        self.width = int(width)
+        self.x_offset = x_offset
+        self.tables = {} #Bearing of each column, by image width
+
+    @classmethod
+    def from_yaml(cls, path, x_offset=0.0):
+        with open(path, "r") as file_handle:
+            calib_data = yaml.safe_load(file_handle)
+        P = calib_data["projection_matrix"]["data"]
+        return cls(P[0], P[2], calib_data["image_width"], x_offset)
+
+    @classmethod
+    def from_camera_info(cls, msg, x_offset=0.0):
+        return cls(msg.P[0], msg.P[2], msg.width, x_offset)
+
+    def intrinsics(self, width):
+        """
+            fx, cx for an image of this width (the image might be reduced).
+        """
+        scale = width / self.width
+        return self.fx * scale, (self.cx + 0.5) * scale - 0.5
+
+    def bearings(self, width):
+        """
+            Bearing (rad) of each column of an image of this width.
+        """
+        table = self.tables.get(width)
+        if table is None:
+            fx, cx = self.intrinsics(width)
+            table = np.arctan2(cx - np.arange(width), fx)
+            table.flags.writeable = False
+            self.tables[width] = table
+        return table
+
+    def column_bearings(self, columns, width):
+        """
+            Bearings of (fractional) columns of an image of this width.
+        """
+        return np.interp(columns, np.arange(width), self.bearings(width))
+
+    def project(self, points, width):
+        """
+            Image columns of points of the turtle frame (N x 2, meters), and whether they are in front of the camera and in the image.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        fx, cx = self.intrinsics(width)
+        x = points[:, 0] - self.x_offset
+        y = points[:, 1]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns = cx - fx * y / x
+        visible = (x > 0) & (columns >= 0) & (columns <= width - 1)
+        return columns, visible
+
+    def point_bearings(self, points):
+        """
+            Bearings (rad) and distances (m) of points of the turtle frame (N x 2) from the camera.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        x = points[:, 0] - self.x_offset
+        return np.arctan2(points[:, 1], x), np.hypot(x, points[:, 1])
+
+
+def interval_overlap(a, b):
+    """
+        Intersection over union of the intervals a (N x 2, low and high) and b (M x 2). N x M.
+    """
+    a = np.asarray(a, dtype=float).reshape(-1, 1, 2)
+    b = np.asarray(b, dtype=float).reshape(1, -1, 2)
+    intersection = np.minimum(a[..., 1], b[..., 1]) - np.maximum(a[..., 0], b[..., 0])
+    union = np.maximum(a[..., 1], b[..., 1]) - np.minimum(a[..., 0], b[..., 0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(intersection > 0, intersection / union, 0.0)
+
+
+def associate(overlap, min_overlap=0.3):
+    """
+        Global assignment of the rows to the columns of an overlap matrix. Returns the (row, column) pairs that overlap enough.
+    """
+    if not overlap.size:
+        return []
+    rows, cols = linear_sum_assignment(-overlap)
+    return [(int(r), int(c)) for r, c in zip(rows, cols) if overlap[r, c] >= min_overlap]
@@ -0,0 +1,65 @@
+import math
+import numpy as np
+
+
+
+"""
+    Change detector for the lidar process.
+
+    A scan is compared to the last processed one: if every beam is within the
+    range tolerance and the turtlebot did not move more than the odometry
+    tolerances, there is nothing new to compute and the scan can be skipped.
+"""
+
+
+
+class ScanChangeDetector:
+    def __init__(self, range_tolerance=0.02, max_changed_beams=0, distance_tolerance=0.01, angle_tolerance=0.02):
+        self.range_tolerance = range_tolerance
+        self.max_changed_beams = max_changed_beams
+        self.distance_tolerance = distance_tolerance
+        self.angle_tolerance = angle_tolerance
+
+        self.processed = 0
+        self.skipped = 0
+
+        self.reset()
+
+    def reset(self):
+        """ Forget the last scan, the next one is always processed. """
+        self.last_ranges = None
+        self.last_pose = None
+
+    def moved(self, pose):
+        """ Did the turtlebot move since the last processed scan? pose is ((x,y), theta). """
+        if pose is None or self.last_pose is None:
+            return False
+
+        (x, y), theta = pose
+        (x0, y0), theta0 = self.last_pose
+
+        angle = (theta - theta0 + math.pi) % (2 * math.pi) - math.pi
+        return math.hypot(x - x0, y - y0) > self.distance_tolerance or abs(angle) > self.angle_tolerance
+
+    def check(self, ranges, pose=None):
+        """
+            Returns True if the scan has to be processed (and keeps it as the reference), False if it can be skipped.
+        """
+        ranges = np.asarray(ranges, dtype=float)
+
+        if self.last_ranges is None or self.last_ranges.shape != ranges.shape or self.moved(pose):
+            changed = True
+        else:
+            # inf == inf for the beams without a return
+            with np.errstate(invalid='ignore'):
+                same = (ranges == self.last_ranges) | (np.abs(ranges - self.last_ranges) <= self.range_tolerance)
+            changed = np.count_nonzero(~same) > self.max_changed_beams
+
+        if changed:
+            self.last_ranges = ranges
+            self.last_pose = pose
+            self.processed += 1
+        else:
+            self.skipped += 1
+
+        return changed
@@ -0,0 +1,67 @@
+import numpy as np
+import cv2 as cv
+
+
+
+"""
+    Multi-class HSV colour classifier.
+
+    All the colour ranges (the same (lower, upper) boxes as cv.inRange) are compiled
+    into one lookup table that maps an HSV pixel to a bitmask, one bit per range.
+    A box test is separable, so the 3D table is stored as three 256-entry tables
+    (one per channel) AND-ed together: the result is exact, and one pass over the
+    image gives the bits of every class, however many classes there are.
+
+    The table only has to be rebuilt when the ranges change (param_change_alert).
+"""
+
+
+
+class ColourClassifier:
+    def __init__(self, classes:dict):
+        """
+            classes maps a name to a list of (lower, upper) HSV ranges. A pixel is of that class if it is in any of its ranges.
+        """
+        n_ranges = sum(len(ranges) for ranges in classes.values())
+        if n_ranges <= 8:
+            dtype = np.uint8
+        elif n_ranges <= 16:
+            dtype = np.uint16
+        else:
+            raise ValueError("The colour classifier supports at most 16 colour ranges.")
+
+        self.lut = np.zeros((1, 256, 3), dtype=dtype)
+        self.class_bits = {}
+
+        bit = 0
+        for name, ranges in classes.items():
+            self.class_bits[name] = 0
+            for lower, upper in ranges:
+                for c in range(3):
+                    lo = max(0, int(lower[c]))
+                    hi = min(255, int(upper[c]))
+                    self.lut[0, lo:hi+1, c] |= dtype(1 << bit)
+                self.class_bits[name] |= 1 << bit
+                bit += 1
+
+    def classify(self, hsv):
+        """
+            Bitmask of the ranges each pixel of the (8 bit) HSV image is in.
+        """
+        per_channel = cv.LUT(hsv, self.lut)
+        return per_channel[:, :, 0] & per_channel[:, :, 1] & per_channel[:, :, 2]
+
+    def mask(self, bits, name):
+        """
+            Mask (0/255, as cv.inRange) of one class, from the bits returned by classify.
+        """
+        return cv.compare(np.bitwise_and(bits, self.class_bits[name]), 0, cv.CMP_NE)
+
+    def masks(self, hsv, names=None):
+        """
+            Masks of the given classes (all of them by default) in one pass over the image.
+        """
+        bits = self.classify(hsv)
+        if names is None:
+            names = self.class_bits.keys()
+        return {name: self.mask(bits, name) for name in names}
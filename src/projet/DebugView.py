@@ -0,0 +1,72 @@
+import rospy
+import numpy as np
+import cv2 as cv
+
+from cv_bridge import CvBridge
+
+from projet.FrameWorker import LatestFrameWorker
+
+
+
+"""
+    Debug visualisation (overlays, grids) that costs nothing when nobody is watching.
+
+    A render function is only submitted when the topic has subscribers and the last
+    publication is older than 1/max_rate. It runs on a background thread (latest
+    submission only), images are downscaled before being converted and published.
+"""
+
+
+
+class DebugPublisher:
+    def __init__(self, topic, msg_class, max_rate=5.0, downscale=1.0, queue_size=1):
+        self.pub = rospy.Publisher(topic, msg_class, queue_size=queue_size)
+        self.bridge = CvBridge()
+        self.configure(max_rate, downscale)
+
+        self.last_submit = None
+        self.worker = LatestFrameWorker(self.render, name="debug" + topic.replace("/", "_"))
+
+    def configure(self, max_rate=5.0, downscale=1.0):
+        """
+            max_rate in Hz (0: no limit), downscale is the scale of the published images.
+        """
+        self.max_rate = max_rate
+        self.downscale = downscale
+
+    def wanted(self):
+        """
+            Is there someone to send a new debug output to? (Check before doing any drawing work.)
+        """
+        if not self.pub.get_num_connections():
+            return False
+        if self.max_rate > 0 and self.last_submit is not None and (rospy.get_time() - self.last_submit) < 1.0 / self.max_rate:
+            return False
+        return True
+
+    def submit(self, render, *args):
+        """
+            Publish render(*args) from the background thread, if wanted. render returns a message or a bgr8 image.
+            The arguments must not be modified afterwards (pass copies of anything that is).
+        """
+        if not self.wanted():
+            return False
+        self.last_submit = rospy.get_time()
+        self.worker.submit((render, args))
+        return True
+
+    def render(self, job):
+        render, args = job
+        msg = render(*args)
+        if msg is None:
+            return
+
+        if isinstance(msg, np.ndarray):
+            if self.downscale != 1.0:
+                msg = cv.resize(msg, None, fx=self.downscale, fy=self.downscale, interpolation=cv.INTER_AREA)
+            msg = self.bridge.cv2_to_imgmsg(msg, "passthrough")
+
+        self.pub.publish(msg)
+
+    def stop(self):
+        self.worker.stop()
@@ -0,0 +1,64 @@
+import numpy as np
+from collections import deque
+
+
+
+"""
+    Motion compensation (de-skewing) of the lidar scans.
+
+    The beams of one sweep are not taken from the same pose when the turtlebot
+    moves. The pose of each beam is interpolated from a buffer of odometry
+    messages, and all the beams are moved into the frame of the latest pose
+    in one vectorized pass.
+"""
+
+
+
+class ScanDeskewer:
+    def __init__(self, buffer_size=100):
+        # (time, x, y, theta) of the last odometry messages
+        self.buffer = deque(maxlen=buffer_size)
+
+    def add_pose(self, t, pos, theta):
+        if len(self.buffer) and t <= self.buffer[-1][0]:
+            # Out of order (or the clock jumped back, e.g. gazebo reset)
+            self.buffer.clear()
+        self.buffer.append((t, pos[0], pos[1], theta))
+
+    def deskew(self, ranges, thetas, times):
+        """
+            Move the beams (ranges, thetas in the turtle frame, measured at times) into the frame of the latest pose.
+            Returns the corrected ranges and thetas.
+        """
+        ranges = np.asarray(ranges, dtype=float)
+        thetas = np.asarray(thetas, dtype=float)
+
+        if len(self.buffer) < 2:
+            return ranges, thetas
+
+        buf = np.array(self.buffer)
+        t = buf[:, 0]
+        th = np.unwrap(buf[:, 3])
+
+        # Pose of the turtlebot for each beam (clamped to the buffer)
+        bx = np.interp(times, t, buf[:, 1])
+        by = np.interp(times, t, buf[:, 2])
+        bth = np.interp(times, t, th)
+
+        ref_x, ref_y, ref_th = buf[-1, 1], buf[-1, 2], th[-1]
+
+        # Beam ends in the odom frame, then in the latest turtle frame
+        a = bth + thetas
+        c, s = np.cos(ref_th), np.sin(ref_th)
+        with np.errstate(invalid='ignore'):
+            dx = bx + ranges * np.cos(a) - ref_x
+            dy = by + ranges * np.sin(a) - ref_y
+            lx = c * dx + s * dy
+            ly = -s * dx + c * dy
+
+        # Missing returns (0 or inf) keep their range, they are only rotated
+        valid = np.isfinite(ranges) & (ranges > 0)
+        new_ranges = np.where(valid, np.hypot(lx, ly), ranges)
+        new_thetas = np.where(valid, np.arctan2(ly, lx), a - ref_th)
+
+        return new_ranges, new_thetas
@@ -0,0 +1,75 @@
+import numpy as np
+import cv2 as cv
+
+
+
+"""
+    Copy-free ingestion of sensor_msgs/Image frames.
+
+    The pixels of the message are exposed as a read-only numpy view of msg.data
+    (with the row step of the message), instead of being copied by CvBridge and
+    then copied again. Anything that draws on a frame has to make its own copy.
+
+    Compressed frames (sensor_msgs/CompressedImage) are decoded directly at a
+    reduced resolution (the JPEG decoder skips the fine detail).
+"""
+
+
+
+# Channels of the 8 bit encodings
+CHANNELS = {'bgr8': 3, 'rgb8': 3, 'bgra8': 4, 'rgba8': 4, 'mono8': 1, '8UC1': 1, '8UC3': 3, '8UC4': 4}
+
+# Conversion to bgr8 of the encodings that are not bgr8 already
+TO_BGR = {'rgb8': cv.COLOR_RGB2BGR, 'bgra8': cv.COLOR_BGRA2BGR, 'rgba8': cv.COLOR_RGBA2BGR, '8UC4': cv.COLOR_BGRA2BGR,
+          'mono8': cv.COLOR_GRAY2BGR, '8UC1': cv.COLOR_GRAY2BGR}
+
+# Decoding flag for each reduction of the resolution
+REDUCED = {1: cv.IMREAD_COLOR, 2: cv.IMREAD_REDUCED_COLOR_2, 4: cv.IMREAD_REDUCED_COLOR_4, 8: cv.IMREAD_REDUCED_COLOR_8}
+
+
+
+def image_view(msg):
+    """
+        Read-only view (no copy) of the pixels of an 8 bit sensor_msgs/Image, (height, width[, channels]).
+    """
+    if not msg.encoding in CHANNELS:
+        raise ValueError("Unsupported image encoding: {}".format(msg.encoding))
+    channels = CHANNELS[msg.encoding]
+
+    if isinstance(msg.data, (bytes, bytearray, memoryview)):
+        data = np.frombuffer(msg.data, dtype=np.uint8)
+    else:
+        # Messages built in python can have a list as data
+        data = np.asarray(msg.data, dtype=np.uint8)
+
+    if data.size < msg.step * (msg.height - 1) + msg.width * channels:
+        raise ValueError("Image data is smaller than its size and step.")
+
+    view = np.lib.stride_tricks.as_strided(data, shape=(msg.height, msg.width, channels), strides=(msg.step, channels, 1), writeable=False)
+
+    if channels == 1:
+        return view[:, :, 0]
+    return view
+
+
+def bgr_view(msg):
+    """
+        The frame as bgr8: a view if the message is already bgr8, otherwise converted (one copy).
+    """
+    view = image_view(msg)
+    if msg.encoding in TO_BGR:
+        return cv.cvtColor(view, TO_BGR[msg.encoding])
+    return view
+
+
+def decode_compressed(msg, reduction=1):
+    """
+        bgr8 frame of a sensor_msgs/CompressedImage, decoded at 1/reduction of its resolution (1, 2, 4 or 8).
+    """
+    if not reduction in REDUCED:
+        raise ValueError("Unsupported decoding reduction: {} (1, 2, 4 or 8)".format(reduction))
+
+    image = cv.imdecode(np.frombuffer(msg.data, dtype=np.uint8), REDUCED[reduction])
+    if image is None:
+        raise ValueError("Could not decode the compressed image ({})".format(msg.format))
+    return image
@@ -0,0 +1,81 @@
+import threading
+import time
+import traceback
+
+
+
+"""
+    Processing of the latest frame only, on a worker thread.
+
+    The ROS callback only puts the newest message in a single slot mailbox (replacing
+    the one that was waiting, if any), and the worker always processes the freshest
+    frame. When the processing is slower than the camera, stale frames are dropped
+    instead of queuing up, so the lag of the lane estimate stays bounded.
+"""
+
+
+
+class LatestFrameWorker:
+    def __init__(self, process, name="frame_worker"):
+        """
+            process is called with each frame, on the worker thread.
+        """
+        self.process = process
+
+        self.condition = threading.Condition()
+        self.slot = None #(frame, arrival time)
+        self.running = True
+
+        #Counters
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.last_age = 0.0 #How old the last frame was when its processing started (s)
+        self.max_age = 0.0
+        self.last_duration = 0.0 #How long the last processing took (s)
+
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame):
+        """
+            Called from the ROS callback: swap in the newest frame and return right away.
+        """
+        with self.condition:
+            if self.slot is not None:
+                self.dropped += 1
+            self.slot = (frame, time.monotonic())
+            self.received += 1
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.slot is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                frame, arrival = self.slot
+                self.slot = None
+
+            start = time.monotonic()
+            self.last_age = start - arrival
+            self.max_age = max(self.max_age, self.last_age)
+
+            try:
+                self.process(frame)
+            except Exception:
+                #Keep the worker alive (a ROS callback would also just print it)
+                traceback.print_exc()
+
+            self.last_duration = time.monotonic() - start
+            self.processed += 1
+
+    def stats(self):
+        return "received {}, processed {}, dropped {}, age {:.3f}s (max {:.3f}s), processing {:.3f}s".format(
+            self.received, self.processed, self.dropped, self.last_age, self.max_age, self.last_duration)
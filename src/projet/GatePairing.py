@@ -0,0 +1,141 @@
+import numpy as np
+from scipy.spatial.distance import cdist
+
+
+
+"""
+    Pairing of the bottles into gates.
+
+    Two bottles can form a gate if their distance is within tolerance of the gate
+    width. All the distances come from one cdist, and the pairing is a maximum
+    weight matching of that (sparse) graph: as many gates as possible, and among
+    those the ones closest to the gate width. The graph splits into small connected
+    components (a few bottles each), each one is matched exactly.
+
+    The pairs are deterministic (ties go to the lowest indices), and are only
+    recomputed when bottles are added or one of them moved more than move_tolerance.
+"""
+
+
+
+class GatePairing:
+    def __init__(self, target_distance=0.46, tolerance=0.06, move_tolerance=0.02, max_component=16):
+        self.target_distance = target_distance
+        self.tolerance = tolerance
+        self.move_tolerance = move_tolerance
+        self.max_component = max_component #Bigger components are matched greedily
+
+        self.positions = None #Positions the pairs were computed with
+        self.last_pairs = []
+
+        self.computed = 0
+        self.reused = 0
+
+    def configure(self, target_distance, tolerance):
+        """
+            New gate width and tolerance. The pairs are only recomputed if they changed.
+        """
+        if (target_distance, tolerance) != (self.target_distance, self.tolerance):
+            self.target_distance = target_distance
+            self.tolerance = tolerance
+            self.positions = None
+
+    def pairs(self, positions):
+        """
+            Gate pairs (i, j), i < j, of the bottles at these positions (N x 2).
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+
+        if self.positions is not None and len(self.positions) == len(positions) and \
+                (not len(positions) or np.max(np.linalg.norm(positions - self.positions, axis=1)) <= self.move_tolerance):
+            self.reused += 1
+            return self.last_pairs
+
+        self.computed += 1
+        self.positions = positions.copy()
+        self.last_pairs = self.match(positions)
+        return self.last_pairs
+
+    def weights(self, positions):
+        """
+            Weight of each possible pair: 1 + how well it fits the gate width (in ]1, 2]), 0 if it can't be a gate.
+        """
+        error = np.abs(cdist(positions, positions) - self.target_distance)
+        weights = np.where(error < self.tolerance, 2 - error / self.tolerance, 0.0)
+        np.fill_diagonal(weights, 0.0)
+        return weights
+
+    def match(self, positions):
+        weights = self.weights(positions)
+        n = len(weights)
+
+        # Connected components of the graph (label propagation on the adjacency)
+        component = np.arange(n)
+        adjacency = weights > 0
+        for _ in range(n):
+            neighbours = np.where(adjacency, component[np.newaxis, :], n).min(axis=1)
+            new = np.minimum(component, neighbours)
+            if np.array_equal(new, component):
+                break
+            component = new
+
+        pairs = []
+        for c in np.unique(component):
+            nodes = np.flatnonzero(component == c)
+            if len(nodes) < 2:
+                continue
+            w = weights[np.ix_(nodes, nodes)]
+            if len(nodes) <= self.max_component:
+                local = exact_matching(w)
+            else:
+                local = greedy_matching(w)
+            pairs += [(int(nodes[i]), int(nodes[j])) for i, j in local]
+
+        return sorted(pairs)
+
+
+def exact_matching(weights):
+    """
+        Maximum weight matching of a small graph (dynamic programming on the subsets of nodes).
+    """
+    n = len(weights)
+    memo = {}
+
+    def best(mask):
+        # Best (weight, pairs) using only the nodes in mask
+        if mask == 0:
+            return 0.0, ()
+        if mask in memo:
+            return memo[mask]
+
+        i = (mask & -mask).bit_length() - 1 #Lowest node: left alone, or paired with one of the others
+        rest = mask & ~(1 << i)
+        result = best(rest)
+
+        for j in range(i + 1, n):
+            if rest >> j & 1 and weights[i, j] > 0:
+                weight, pairs = best(rest & ~(1 << j))
+                if weight + weights[i, j] > result[0]:
+                    result = (weight + weights[i, j], ((i, j),) + pairs)
+
+        memo[mask] = result
+        return result
+
+    return list(best((1 << n) - 1)[1])
+
+
+def greedy_matching(weights):
+    """
+        Heaviest pairs first (for components too big to be matched exactly).
+    """
+    i, j = np.triu_indices(len(weights), 1)
+    order = np.lexsort((j, i, -weights[i, j]))
+    used = set()
+    pairs = []
+    for k in order:
+        if weights[i[k], j[k]] <= 0:
+            break
+        if not i[k] in used and not j[k] in used:
+            used.update((i[k], j[k]))
+            pairs.append((int(i[k]), int(j[k])))
+    return pairs
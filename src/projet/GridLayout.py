@@ -0,0 +1,134 @@
+import numpy as np
+
+
+
+"""
+    Canonical in-memory layout of the occupancy grids, shared by all the nodes.
+
+    A grid is a 2D array of shape (height, width), seen from above like an image:
+
+        row 0       is the farthest cell in front of the turtlebot,
+        row H-1     is the row the turtlebot stands on,
+        column W//2 is straight ahead, columns increase towards the right (-y).
+
+    This is the layout the RRT* planner works in. The nav_msgs/OccupancyGrid
+    message uses another one (x forward along the columns, y left along the rows),
+    so conversions only happen when reading or writing a message, as strided views.
+"""
+
+
+
+def robot_cell(shape):
+    """ Cell the turtlebot stands on. """
+    return (shape[0]-1, shape[1]//2)
+
+
+def rel_to_grid(rel, shape, cpm):
+    """
+        Transform from relative (turtle frame, meters) to grid cells.
+        Works on a single (x,y) tuple or on an N x 2 array.
+    """
+    rel = np.asarray(rel, dtype=float)
+    row = (shape[0]-1) - rel[..., 0]*cpm
+    col = (shape[1]//2) - rel[..., 1]*cpm
+    cells = np.stack((row, col), axis=-1).astype(int)
+    if cells.ndim == 1:
+        return (int(cells[0]), int(cells[1]))
+    return cells
+
+
+def grid_to_rel(cells, shape, cpm):
+    """
+        Transform from grid cells to relative (turtle frame, meters).
+        Works on a single (row,col) tuple or on an N x 2 array.
+    """
+    cells = np.asarray(cells, dtype=float)
+    x = ((shape[0]-1) - cells[..., 0])/cpm
+    y = ((shape[1]//2) - cells[..., 1])/cpm
+    if cells.ndim == 1:
+        return (float(x), float(y))
+    return np.stack((x, y), axis=-1)
+
+
+def cell_offset(cell, shape):
+    """
+        Offset of a cell from the front of the turtlebot, in cells: (forward, right).
+        Used to get headings and distances to goals.
+    """
+    return (shape[0] - cell[0], cell[1] - 0.5*shape[1])
+
+
+def msg_to_grid(msg):
+    """
+        View on the data of an OccupancyGrid message in the canonical layout (no copy).
+    """
+    data = np.asarray(msg.data, dtype=np.int8).reshape(msg.info.height, msg.info.width)
+    return data[::-1, ::-1].T
+
+
+def fill_grid_msg(oc, grid, cpm):
+    """
+        Fill the info and data of an OccupancyGrid message from a canonical grid.
+        The only copy is the flattening of the data.
+    """
+    oc.info.origin.position.y -= ((grid.shape[1] / 2)) / cpm
+    oc.info.width = grid.shape[0]
+    oc.info.height = grid.shape[1]
+    oc.info.resolution = 1 / cpm
+    oc.data = grid.T[::-1, ::-1].ravel().tolist()
+    return oc
+
+
+
+class PoseTransform:
+    """
+        Transforms between the odom frame, the turtle frame and the grid cells for one pose of the turtlebot,
+        as a 3x3 homogeneous matrix (turtle -> odom) and the grid affine. Works on (x,y) tuples or N x 2 arrays.
+        Without shape and cpm, only the turtle <-> odom transforms are available.
+    """
+    def __init__(self, pos, theta, shape=None, cpm=None):
+        c, s = np.cos(theta), np.sin(theta)
+        self.odom_from_turtle = np.array([[c, -s, pos[0]],
+                                          [s,  c, pos[1]],
+                                          [0,  0, 1]])
+        self.turtle_from_odom = np.linalg.inv(self.odom_from_turtle)
+
+        if shape is None:
+            return
+
+        # Grid cells (row, col) from the turtle frame (see rel_to_grid)
+        self.grid_from_turtle = np.array([[-cpm, 0, 0],
+                                          [0, -cpm, 0],
+                                          [0, 0, 1]], dtype=float)
+        self.grid_from_turtle[0, 2] = shape[0]-1
+        self.grid_from_turtle[1, 2] = shape[1]//2
+        self.turtle_from_grid = np.linalg.inv(self.grid_from_turtle)
+
+        self.grid_from_odom = self.grid_from_turtle @ self.turtle_from_odom
+        self.odom_from_grid = self.odom_from_turtle @ self.turtle_from_grid
+
+    @staticmethod
+    def apply(matrix, points):
+        points = np.asarray(points, dtype=float)
+        return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+    def turtle_to_odom(self, rel):
+        return self.single(self.apply(self.odom_from_turtle, rel))
+
+    def odom_to_turtle(self, odom):
+        return self.single(self.apply(self.turtle_from_odom, odom))
+
+    def grid_to_odom(self, cells):
+        return self.single(self.apply(self.odom_from_grid, cells))
+
+    def odom_to_grid(self, odom):
+        cells = self.apply(self.grid_from_odom, odom).astype(int)
+        if cells.ndim == 1:
+            return (int(cells[0]), int(cells[1]))
+        return cells
+
+    @staticmethod
+    def single(points):
+        if points.ndim == 1:
+            return (float(points[0]), float(points[1]))
+        return points
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+
+"""
+    Obstacles of the last challenge that the LiDAR doesn't give: the bottles
+    (they might not be seen) and the closed gates (a line between their bottles).
+
+    They are kept in the odom frame. The closure of a gate is sampled once (every
+    half cell along the line) and only again when its bottles moved by more than the
+    move tolerance of the GateRegistry (see GateRegistry.version). Each
+    tick, all the layers are moved into the grid with one batch transform, and
+    written with one fancy-index write.
+"""
+
+
+
+class GridOverlay:
+    def __init__(self, cpm=50):
+        self.cpm = cpm
+        self.closures = {} #Gate index: (geometry version, odom points)
+
+    def closure(self, gate, version, p1, p2):
+        """
+            Points (odom frame) of the line closing a gate, cached until the geometry version of the gate changes.
+        """
+        cached = self.closures.get(gate)
+        if cached is None or cached[0] != version:
+            p1 = np.asarray(p1, dtype=float)
+            p2 = np.asarray(p2, dtype=float)
+            n = int(np.ceil(np.linalg.norm(p2 - p1) * self.cpm * 2)) + 1
+            t = np.linspace(0, 1, n)[:, np.newaxis]
+            cached = (version, p1 + t * (p2 - p1))
+            self.closures[gate] = cached
+        return cached[1]
+
+    def composite(self, grid, frames, layers):
+        """
+            Write the layers [(odom points N x 2, value), ...] on the grid (in place), the later layers on top.
+            frames is the projet.GridLayout.PoseTransform of the current pose.
+        """
+        layers = [(np.asarray(points, dtype=float).reshape(-1, 2), value) for points, value in layers]
+        if not sum(len(points) for points, _ in layers):
+            return grid
+
+        points = np.concatenate([points for points, _ in layers])
+        values = np.concatenate([np.full(len(points), value) for points, value in layers])
+
+        cells = frames.odom_to_grid(points)
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < grid.shape[0]) & (cells[:, 1] >= 0) & (cells[:, 1] < grid.shape[1])
+        flat = np.ravel_multi_index((cells[inside, 0], cells[inside, 1]), grid.shape[:2])
+        values = values[inside]
+
+        # Only the last value written to each cell (the top layer)
+        _, last = np.unique(flat[::-1], return_index=True)
+        keep = len(flat) - 1 - last
+
+        rows, cols = np.unravel_index(flat[keep], grid.shape[:2])
+        grid[rows, cols] = values[keep]
+        return grid
+
+    def reset(self):
+        self.closures = {}
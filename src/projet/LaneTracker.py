@@ -0,0 +1,120 @@
+import numpy as np
+
+
+
+"""
+    Lane fitting on a birdseye lane mask, tracked from frame to frame.
+
+    The first fit (or the fit after losing the lane) uses sliding windows. After that,
+    only the pixels in a band around the previous fit are used, selected with one
+    vectorized test, and the coefficients are smoothed over time.
+
+    The parameters are for a 800x450 birdseye view, and are scaled for other resolutions.
+"""
+
+
+
+def sliding_window_fit(img, lane='left', scale=1.0, nwindows=50):
+    """
+        Fit x = a*y**2 + b*y + c on the lane pixels found with sliding windows, starting from the column histogram.
+        Returns the coefficients, or None if there are not enough pixels.
+    """
+    # Calculate the histogram of the bottom half of the image
+    histogram = np.sum(img[img.shape[0]//2:,:], axis=0)
+    midpoint = int(histogram.shape[0]/2)
+
+    # Initial base positions for the left and right x-coordinates
+    if lane == 'left':
+        x_base = np.argmax(histogram[:midpoint])
+    elif lane == 'right':
+        x_base = np.argmax(histogram[midpoint:]) + midpoint
+    else:
+        raise ValueError("Invalid lane specified. Use 'left' or 'right'.")
+
+    # Parameters
+    margin = int(50*scale)
+    minpix = int(50*scale)
+    window_height = int(img.shape[0]/nwindows)
+
+    # Lane finding. nonzero() is sorted by row, so the pixels of a window are a slice.
+    lane_indices = []
+    x_current = x_base
+    y, x = img.nonzero()
+
+    for window in range(nwindows):
+        win_y_low = img.shape[0] - (window+1) * window_height
+        win_y_high = img.shape[0] - window * window_height
+        low, high = np.searchsorted(y, [win_y_low, win_y_high])
+
+        good_indices = np.flatnonzero((x[low:high] >= x_current - margin) & (x[low:high] < x_current + margin)) + low
+        lane_indices.append(good_indices)
+
+        if len(good_indices) > minpix:
+            x_current = int(np.mean(x[good_indices]))
+
+    lane_indices = np.concatenate(lane_indices)
+
+    if len(lane_indices) < 3000*scale*scale:
+        return None
+
+    return polyfit(y[lane_indices], x[lane_indices])
+
+
+def polyfit(y, x):
+    try:
+        return np.polyfit(y, x, 2)
+    except Exception:
+        return None
+
+
+
+class LaneTracker:
+    def __init__(self, lane='left', smoothing=0.5):
+        """
+            smoothing is the weight of the previous coefficients (0: no smoothing).
+        """
+        self.lane = lane
+        self.smoothing = smoothing
+        self.fit = None
+
+        #How many frames were fitted around the previous fit, and with the windows.
+        self.tracked = 0
+        self.searched = 0
+
+    def reset(self):
+        self.fit = None
+
+    def search_around(self, img, scale=1.0):
+        """
+            Fit on the pixels within the margin of the previous fit. Returns None if there are not enough pixels.
+        """
+        margin = 50*scale
+
+        y, x = img.nonzero()
+        good = np.abs(x - np.polyval(self.fit, y)) < margin
+
+        if np.count_nonzero(good) < 3000*scale*scale:
+            return None
+
+        return polyfit(y[good], x[good])
+
+    def update(self, img, scale=1.0):
+        """
+            Fit the lane on a new frame. Returns the (smoothed) coefficients, or None if the lane is lost.
+        """
+        fit = None
+        if self.fit is not None:
+            fit = self.search_around(img, scale)
+
+        if fit is not None:
+            self.tracked += 1
+            self.fit = self.smoothing * self.fit + (1 - self.smoothing) * fit
+        else:
+            # Lost (or first frame): full window search, no smoothing with the old fit
+            self.searched += 1
+            self.fit = sliding_window_fit(img, self.lane, scale)
+
+        return self.fit
+
+    def stats(self):
+        return "tracked {}, searched {}".format(self.tracked, self.searched)
@@ -1,105 +1,236 @@
 import numpy as np
-import math
 
 
 
 """
     CLASSES THE FOR THE LAST CHALLENGE
+
+    The bottles and gates are stored in arrays (BottleRegistry, GateRegistry).
+    Bottle and Gate are small views on one entry, with the same getters/setters
+    as before. The geometry of the gates (center, offset points) is only
+    recomputed when one of their bottles moved, for all those gates at once.
 """
 
 
 
+class BottleRegistry:
+    def __init__(self, capacity=16):
+        self.positions = np.zeros((capacity, 2))
+        self.gate = np.full(capacity, -1, dtype=int) #-1 is no gate
+        self.colour = np.full(capacity, -1, dtype=int) #-1 is no colour
+        self.n = 0
+        self.version = 0 #Incremented when a bottle is added or moved
+
+        self.gates = None #GateRegistry whose geometry depends on these bottles
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.n
+        if not 0 <= index < self.n:
+            raise IndexError("bottle index out of range")
+        return Bottle(self, index)
+
+    def __iter__(self):
+        return (Bottle(self, i) for i in range(self.n))
+
+    def add(self, position):
+        """
+            New bottle at this position. Returns its view.
+        """
+        if self.n == len(self.positions):
+            self.positions = np.vstack((self.positions, np.zeros_like(self.positions)))
+            self.gate = np.concatenate((self.gate, np.full_like(self.gate, -1)))
+            self.colour = np.concatenate((self.colour, np.full_like(self.colour, -1)))
+
+        self.positions[self.n] = position
+        self.n += 1
+        self.version += 1
+        return Bottle(self, self.n - 1)
+
+    def get_positions(self):
+        """
+            Positions of all the bottles (N x 2 view).
+        """
+        return self.positions[:self.n]
+
+    def set_positions(self, indices, positions):
+        """
+            Move some bottles at once. The gates they are in are recomputed when needed.
+        """
+        indices = np.asarray(indices, dtype=int)
+        if not len(indices):
+            return
+        self.positions[indices] = positions
+        self.version += 1
+        if not self.gates is None:
+            self.gates.bottles_moved(indices)
+
+
+
 class Bottle:
-    def __init__(self, index, position=None, gate=None, colour=None):
+    __slots__ = ('registry', 'index')
+
+    def __init__(self, registry:BottleRegistry, index:int):
+        self.registry = registry
         self.index = index
-        self.position = position
-        self.gate = gate
-        self.colour = colour
 
     def get_position(self):
-        return (self.position[0], self.position[1])
-    
+        position = self.registry.positions[self.index]
+        return (position[0], position[1])
+
     def set_position(self, position:tuple):
-        self.position = position
+        self.registry.set_positions([self.index], [position])
 
     def set_colour(self, colour:int):
-        self.colour = colour
+        self.registry.colour[self.index] = -1 if colour is None else colour
 
     def get_colour(self):
-        return self.colour
+        colour = self.registry.colour[self.index]
+        return None if colour < 0 else int(colour)
 
     def set_gate(self, gate:int):
-        self.gate = gate
+        self.registry.gate[self.index] = -1 if gate is None else gate
 
     def get_gate(self):
-        return self.gate
-    
+        gate = self.registry.gate[self.index]
+        return None if gate < 0 else int(gate)
+
     def get_index(self):
         return self.index
-        
 
 
-class Gate:
-    def __init__(self, center_position=None, bottle_index1=None, bottle_index2=None, colour=None):
-        self.center_position = center_position
-        self.bottle_index1 = bottle_index1
-        self.bottle_index2 = bottle_index2
 
-        self.offset_point1 = None
-        self.offset_point2 = None
+class GateRegistry:
+    def __init__(self, bottles:BottleRegistry, offset=0.24, capacity=8, move_tolerance=0.02):
+        """
+            The offset is how far from the center of the gate the offset points are. (Self.sim 0.24)
+            The version of a gate only changes when one of its bottles moved more than move_tolerance (m) since the last change.
+        """
+        self.bottles = bottles
+        bottles.gates = self
+        self.offset = offset
+        self.move_tolerance = move_tolerance
+
+        self.pairs = np.zeros((capacity, 2), dtype=int) #Bottle indices
+        self.colour = np.full(capacity, -1, dtype=int)
+        self.confirmed = np.zeros(capacity, dtype=bool)
+        self.centers = np.zeros((capacity, 2))
+        self.offset_points = np.zeros((capacity, 2, 2))
+        self.dirty = np.zeros(capacity, dtype=bool) #Geometry to recompute
+        self.version = np.zeros(capacity, dtype=int) #Incremented when the bottles moved more than move_tolerance
+        self.endpoints = np.zeros((capacity, 2, 2)) #Bottle positions at the last version
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.n
+        if not 0 <= index < self.n:
+            raise IndexError("gate index out of range")
+        return Gate(self, index)
+
+    def __iter__(self):
+        return (Gate(self, i) for i in range(self.n))
+
+    def add(self, bottle_index1, bottle_index2):
+        """
+            New gate between two bottles. Returns its view.
+        """
+        if self.n == len(self.pairs):
+            grow = len(self.pairs)
+            self.pairs = np.vstack((self.pairs, np.zeros((grow, 2), dtype=int)))
+            self.colour = np.concatenate((self.colour, np.full(grow, -1, dtype=int)))
+            self.confirmed = np.concatenate((self.confirmed, np.zeros(grow, dtype=bool)))
+            self.centers = np.vstack((self.centers, np.zeros((grow, 2))))
+            self.offset_points = np.concatenate((self.offset_points, np.zeros((grow, 2, 2))))
+            self.dirty = np.concatenate((self.dirty, np.zeros(grow, dtype=bool)))
+            self.version = np.concatenate((self.version, np.zeros(grow, dtype=int)))
+            self.endpoints = np.concatenate((self.endpoints, np.zeros((grow, 2, 2))))
+
+        self.pairs[self.n] = (bottle_index1, bottle_index2)
+        self.dirty[self.n] = True
+        self.version[self.n] += 1
+        self.endpoints[self.n] = self.bottles.positions[[bottle_index1, bottle_index2]]
+        self.n += 1
+        return Gate(self, self.n - 1)
+
+    def bottles_moved(self, indices):
+        self.dirty[:self.n] |= np.isin(self.pairs[:self.n], indices).any(axis=1)
+
+    def refresh(self):
+        """
+            Recompute the geometry of all the gates whose bottles moved.
+        """
+        dirty = np.flatnonzero(self.dirty[:self.n])
+        if not len(dirty):
+            return
 
-        self.confirmed = False
-        self.colour = colour
+        c1 = self.bottles.positions[self.pairs[dirty, 0]]
+        c2 = self.bottles.positions[self.pairs[dirty, 1]]
 
-        # print("New gate alert! :", self.bottle_index1,self.bottle_index2)
+        vec = c1 - c2
+        perp_vec = np.column_stack((-vec[:, 1], vec[:, 0]))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            unit_perp_vec = perp_vec / np.linalg.norm(perp_vec, axis=1, keepdims=True)
 
-    def confirm(self):
-        self.confirmed = True
+        centers = (c1 + c2) * 0.5
 
-    def get_center_pos(self):
-        return self.center_position
-    
-    def set_colour(self, colour:int, bottles:list):
-        bottles[self.bottle_index1].set_colour(colour)
-        bottles[self.bottle_index2].set_colour(colour)
-
-        self.colour = colour
-    
-    def get_colour(self):
-        return self.colour
-    
-    def get_bottles_indices(self):
-        return self.bottle_index1, self.bottle_index2
-    
-    def get_offset_points(self):
-        return self.offset_point1, self.offset_point2
+        self.centers[dirty] = centers
+        self.offset_points[dirty, 0] = centers + self.offset * unit_perp_vec
+        self.offset_points[dirty, 1] = centers - self.offset * unit_perp_vec
+        self.dirty[dirty] = False
 
-    def update(self, bottles:list):
+        # The bottles are filtered at every grid, only real moves make a new version
+        endpoints = np.stack((c1, c2), axis=1)
+        moved = np.linalg.norm(endpoints - self.endpoints[dirty], axis=2).max(axis=1) > self.move_tolerance
+        self.version[dirty[moved]] += 1
+        self.endpoints[dirty[moved]] = endpoints[moved]
 
-        """
-            Update the positions with the new measurements.
-        """
 
-        c1 = bottles[self.bottle_index1].get_position()
-        c2 = bottles[self.bottle_index2].get_position()
 
-        vec = np.array(c1) - np.array(c2)
-        perp_vec = np.array([-vec[1], vec[0]])
-        unit_perp_vec = perp_vec / np.linalg.norm(perp_vec)
+class Gate:
+    __slots__ = ('registry', 'index')
 
+    def __init__(self, registry:GateRegistry, index:int):
+        self.registry = registry
+        self.index = index
+
+    def confirm(self):
+        self.registry.confirmed[self.index] = True
 
+    def get_center_pos(self):
+        self.registry.refresh()
+        center = self.registry.centers[self.index]
+        return (center[0], center[1])
+
+    def set_colour(self, colour:int, bottles:BottleRegistry=None):
         """
-            The offset is how far from the center of the gate the offset points are.
+            This also sets the colour of the two bottles.
         """
+        registry = self.registry
+        registry.bottles.colour[registry.pairs[self.index]] = colour
+        registry.colour[self.index] = colour
 
+    def get_colour(self):
+        colour = self.registry.colour[self.index]
+        return None if colour < 0 else int(colour)
 
-        offset = 0.24 #Self.sim 0.24 
-
-        cX = np.mean([c1[0],c2[0]])
-        cY = np.mean([c1[1],c2[1]])
+    def get_bottles_indices(self):
+        b1, b2 = self.registry.pairs[self.index]
+        return int(b1), int(b2)
 
-        self.center_position = (cX, cY)
+    def get_offset_points(self):
+        self.registry.refresh()
+        points = self.registry.offset_points[self.index]
+        return points[0].copy(), points[1].copy()
 
-        self.offset_point1 = np.array(self.center_position) + offset * unit_perp_vec
-        self.offset_point2 = np.array(self.center_position) - offset * unit_perp_vec
-        
\ No newline at end of file
+    def update(self, bottles:BottleRegistry=None):
+        """
+            The bottles moved (this is done automatically by BottleRegistry.set_positions).
+        """
+        self.registry.dirty[self.index] = True
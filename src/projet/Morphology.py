@@ -0,0 +1,59 @@
+import numpy as np
+import cv2 as cv
+from functools import lru_cache
+
+
+
+"""
+    Morphology on the occupancy grids, shared by the controller, the perception
+    stages and the lidar node.
+
+    The grids only hold small values (0..100), so everything is done in uint8
+    with OpenCV (cv.medianBlur, cv.dilate) instead of scipy/skimage on int or float
+    arrays. The structuring elements are built once and cached (read-only).
+"""
+
+
+
+@lru_cache(maxsize=None)
+def disk(radius):
+    """
+        Disk of cells within radius of the center (same as skimage.morphology.disk), uint8.
+    """
+    r = int(radius)
+    y, x = np.ogrid[-r:r+1, -r:r+1]
+    structure = ((y**2 + x**2) <= radius**2).astype(np.uint8)
+    structure.flags.writeable = False
+    return structure
+
+
+@lru_cache(maxsize=None)
+def square(size):
+    structure = np.ones((size, size), np.uint8)
+    structure.flags.writeable = False
+    return structure
+
+
+def as_uint8(grid):
+    if np.ma.isMaskedArray(grid):
+        grid = grid.filled(0)
+    if grid.dtype == np.bool_ or grid.dtype == np.uint8:
+        return grid.view(np.uint8)
+    return np.clip(grid, 0, 255).astype(np.uint8)
+
+
+def median(grid, size=3):
+    """
+        Median filter (noise reduction) of a grid, uint8. The border is replicated (medfilt2d pads with zeros).
+    """
+    return cv.medianBlur(np.ascontiguousarray(as_uint8(grid)), size)
+
+
+def dilate(mask, structure):
+    """
+        Dilation of a mask by a structuring element (see disk and square). Returns a boolean mask.
+
+        Even sized elements are anchored like convolve2d(..., mode="same", boundary="symm").
+    """
+    mask = as_uint8(np.asarray(mask) != 0)
+    return cv.dilate(mask, structure, borderType=cv.BORDER_REPLICATE) > 0
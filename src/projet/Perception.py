@@ -0,0 +1,128 @@
+import numpy as np
+import cv2 as cv
+from scipy import ndimage
+from sklearn.cluster import DBSCAN
+
+from projet.Blobs import Blobs
+from projet.Morphology import median, disk
+
+
+
+"""
+    The perception stages of the controller, as plain functions of an array.
+
+    They don't touch the controller state, so they can run inline or in a worker
+    process (see projet.PerceptionPool), and only return compact results (Blobs,
+    bottle centroids).
+
+    The bottles are clustered on the grid itself: with eps of a few cells, DBSCAN
+    is the same as connected components of the dilated core cells, which doesn't
+    need a tree of the points at every tick. DBSCAN is kept for comparison.
+"""
+
+
+
+def roi_view(image, roi):
+    """
+        View (no copy) of the region of interest (row start, row stop, col start, col stop) of an image.
+    """
+    return image[roi[0]:roi[1], roi[2]:roi[3]]
+
+
+def roi_offset(roi):
+    """
+        (x, y) offset of the region of interest in the image.
+    """
+    return (roi[2] or 0, roi[0] or 0)
+
+
+def lane_blobs(image, classifier, rois, names=('left', 'right', 'stepline'), kernel_size=15):
+    """
+        Blobs of each colour class (in frame coordinates), each one only on its region of interest.
+    """
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    bits_rois = {} #Regions shared by several classes are only converted and classified once
+    blobs = {}
+
+    for name in names:
+        roi = rois[name]
+        if not roi in bits_rois:
+            hsv = cv.cvtColor(roi_view(image, roi), cv.COLOR_BGR2HSV)
+            bits_rois[roi] = classifier.classify(hsv)
+
+        mask = cv.morphologyEx(classifier.mask(bits_rois[roi], name), cv.MORPH_CLOSE, kernel) #fill in mask
+        blobs[name] = Blobs(mask, offset=roi_offset(roi))
+
+    return blobs
+
+
+def colour_blobs(image, classifier, names=('blue', 'green', 'yellow')):
+    """
+        Blobs of each colour class on the whole image (one pass for all the classes).
+    """
+    hsv = cv.cvtColor(image, cv.COLOR_BGR2HSV)
+    masks = classifier.masks(hsv, names)
+    return {name: Blobs(mask) for name, mask in masks.items()}
+
+
+def bottle_clusters(grid, eps=3, min_samples=10, max_size=30, occupied=100, method='label'):
+    """
+        Cluster the occupied cells of the lidar grid into bottle shaped obstacles.
+        Returns the (row, col) centroid of each cluster that is small enough to be a bottle.
+
+        method 'label' does it with connected components on the grid, 'dbscan' with sklearn's DBSCAN (for comparison).
+    """
+    grid = median(grid, 3) #Noise reduction
+    occupied_mask = grid == occupied
+
+    if not occupied_mask.any():
+        return []
+
+    if method == 'dbscan':
+        return dbscan_clusters(occupied_mask, eps, min_samples, max_size)
+    elif method == 'label':
+        return label_clusters(occupied_mask, eps, min_samples, max_size)
+    else:
+        raise ValueError("Invalid clustering method specified. Use 'label' or 'dbscan'.")
+
+
+def label_clusters(occupied_mask, eps=3, min_samples=10, max_size=30):
+    """
+        DBSCAN on a regular grid, with connected components (linear in the number of cells):
+        core cells have at least min_samples occupied cells within eps (themselves included),
+        and core cells closer than about eps are in the same component once dilated by eps/2.
+        As with DBSCAN, only the core cells count for the centroid and the size.
+    """
+    counts = ndimage.convolve(occupied_mask.astype(np.int32), disk(eps).astype(np.int32), mode='constant')
+    core = occupied_mask & (counts >= min_samples)
+
+    labels, n_clusters = ndimage.label(ndimage.binary_dilation(core, structure=disk(eps / 2)))
+    if not n_clusters:
+        return []
+
+    index = np.arange(1, n_clusters + 1)
+    sizes = ndimage.sum(core, labels, index)
+    centers = ndimage.center_of_mass(core, labels, index)
+
+    #If we have toooooo many samples, it's probably not a bottle.
+    return [(round(center[0]), round(center[1])) for center, size in zip(centers, sizes) if size > 0 and size < max_size]
+
+
+def dbscan_clusters(occupied_mask, eps=3, min_samples=10, max_size=30):
+    cells = np.argwhere(occupied_mask)
+
+    clustering = DBSCAN(eps=eps, min_samples=min_samples).fit(cells)
+
+    labels = clustering.labels_
+    core_samples_mask = np.zeros_like(labels, dtype=bool)
+    core_samples_mask[clustering.core_sample_indices_] = True
+
+    centroids = []
+    for k in set(labels):
+        xy = cells[(labels == k) & core_samples_mask]
+
+        #If we have toooooo many samples, it's probably not a bottle.
+        if len(xy) > 0 and len(xy) < max_size:
+            centroids.append((round(np.mean(xy[:, 0])), round(np.mean(xy[:, 1]))))
+
+    return centroids
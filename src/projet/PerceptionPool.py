@@ -0,0 +1,97 @@
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+
+
+"""
+    Worker processes for the perception stages (see projet.Perception).
+
+    Everything in the controller shares one GIL, so the vision and lidar stages
+    are run in a pool of processes instead. The input arrays (frames, grids) are
+    written into one shared memory buffer per stage, which the workers map
+    without copying, and only the compact results are pickled back.
+
+    Calls block the calling thread (the GIL is released while waiting), so stages
+    called from different threads (image worker, control loop) run in parallel.
+"""
+
+
+
+#Shared memory blocks attached in this worker process, by name
+_attached = {}
+
+
+def _run_shared(function, name, shape, dtype, args):
+    """
+        Worker side: map the stage buffer and run the stage on it.
+    """
+    if not name in _attached:
+        if len(_attached) >= 8:
+            # Buffers that were replaced by bigger ones
+            for shm in _attached.values():
+                shm.close()
+            _attached.clear()
+        _attached[name] = shared_memory.SharedMemory(name=name)
+
+    array = np.ndarray(shape, dtype=dtype, buffer=_attached[name].buf)
+    try:
+        return function(array, *args)
+    finally:
+        del array
+
+
+
+class PerceptionPool:
+    def __init__(self, workers=2):
+        # No fork of a process with (ROS) threads running
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("forkserver"))
+
+        self.buffers = {} #Shared memory buffer of each stage
+        self.locks = {} #A buffer is not written while a worker reads it
+        self.locks_lock = threading.Lock() #The stages are called from several threads
+        self.futures = set() #Submitted and not finished yet
+
+    def buffer(self, stage, nbytes):
+        shm = self.buffers.get(stage)
+        if shm is None or shm.size < nbytes:
+            if not shm is None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+            self.buffers[stage] = shm
+        return shm
+
+    def lock(self, stage):
+        with self.locks_lock:
+            if not stage in self.locks:
+                self.locks[stage] = threading.Lock()
+            return self.locks[stage]
+
+    def run(self, stage, function, array, *args):
+        """
+            Run function(array, *args) in a worker process and return its result.
+        """
+        array = np.asarray(array)
+        with self.lock(stage):
+            shm = self.buffer(stage, array.nbytes)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            future = self.executor.submit(_run_shared, function, shm.name, array.shape, array.dtype.str, args)
+            self.futures.add(future)
+            try:
+                return future.result()
+            finally:
+                self.futures.discard(future)
+
+    def close(self):
+        try:
+            # (shutdown has no cancel_futures before python 3.9)
+            for future in list(self.futures):
+                future.cancel()
+            self.executor.shutdown(wait=False)
+        finally:
+            for shm in self.buffers.values():
+                shm.close()
+                shm.unlink()
+            self.buffers = {}
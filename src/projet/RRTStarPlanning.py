@@ -4,6 +4,8 @@ import numpy as np
 import rospy
 from skimage.draw import line
 
+from projet.GridLayout import robot_cell, rel_to_grid, grid_to_rel
+
 
 """
     Classes to handle RRT* path planning, used for the bottle challenge.
@@ -41,7 +43,7 @@ class RRTStarPlanning:
         self.occugrid = occugrid
 
         #The turtlebot is at this position, as this is how the occugrid is made.
-        self.start = (self.occugrid.shape[0]-1, occugrid.shape[1]//2)
+        self.start = robot_cell(self.occugrid.shape)
     
 
     def plan(self, end):
@@ -52,15 +54,11 @@ class RRTStarPlanning:
         return self.RRT()
     
     def rel_to_grid(self, rel):
-        """ transform from relative to occugrid """
-        x = (self.occugrid.shape[0]-1) - (rel[0]*self.cpm)
-        y = (self.occugrid.shape[1]//2) - (rel[1]*self.cpm)
-        return (int(x),int(y))
+        """ transform from relative to occugrid (see projet.GridLayout) """
+        return rel_to_grid(rel, self.occugrid.shape, self.cpm)
     
     def grid_to_rel(self, grid):
-        x = (self.occugrid.shape[0]-1 - grid[0])/self.cpm
-        y = ((self.occugrid.shape[1]//2) - grid[1])/self.cpm
-        return (x, y)
+        return grid_to_rel(grid, self.occugrid.shape, self.cpm)
     
     def collision(self, x1, y1, x2, y2):
         # Switched from bresenham to skimage.draw.line
@@ -0,0 +1,58 @@
+import numpy as np
+import cv2 as cv
+
+
+
+"""
+    Birdseye road occupancy grid from the camera.
+
+    The perspective transform is computed once, as cv.remap tables that go from
+    the birdseye view (at the resolution the lanes are fitted at) to the camera
+    image. Lane masks are warped with them, and once the lanes are fitted the road
+    between them is rasterized analytically at the resolution of the grid, instead
+    of filling the polygon, unwarping, blending and warping the image again.
+"""
+
+
+
+class RoadGridProjector:
+    def __init__(self, source_points, destination_points, warped_size, fit_scale=0.5, grid_size=(40, 22), fill_rows=6):
+        """
+            source_points/destination_points/warped_size define the birdseye view (as for cv.getPerspectiveTransform).
+            The lanes are fitted at fit_scale of warped_size, grid_size is (columns, rows) of the road grid,
+            and the last fill_rows rows (right in front of the turtlebot, not seen by the camera) copy the last seen row.
+        """
+        self.fit_scale = fit_scale
+        self.fit_size = (int(warped_size[0] * fit_scale), int(warped_size[1] * fit_scale))
+        self.grid_size = grid_size
+        self.fill_rows = fill_rows
+
+        # For every pixel of the birdseye view, the camera pixel it comes from
+        matrix = cv.getPerspectiveTransform(np.float32(source_points), np.float32(destination_points) * fit_scale)
+        u, v = np.meshgrid(np.arange(self.fit_size[0], dtype=np.float64), np.arange(self.fit_size[1], dtype=np.float64))
+        src = np.tensordot(np.linalg.inv(matrix), np.stack((u, v, np.ones_like(u))), axes=1)
+        map_x = (src[0] / src[2]).astype(np.float32)
+        map_y = (src[1] / src[2]).astype(np.float32)
+        self.map1, self.map2 = cv.convertMaps(map_x, map_y, cv.CV_16SC2)
+
+        # Centres of the grid cells, in birdseye (fitting resolution) pixels
+        self.cell_u = (np.arange(grid_size[0]) + 0.5) * self.fit_size[0] / grid_size[0]
+        self.cell_v = (np.arange(grid_size[1]) + 0.5) * self.fit_size[1] / grid_size[1]
+
+    def warp(self, mask):
+        """ Birdseye view of a camera mask, at the fitting resolution. """
+        return cv.remap(mask, self.map1, self.map2, cv.INTER_NEAREST, borderMode=cv.BORDER_CONSTANT, borderValue=0)
+
+    def to_grid(self, warped_mask):
+        """ Cells of the grid that contain some of a birdseye mask. """
+        return cv.resize(warped_mask, self.grid_size, interpolation=cv.INTER_AREA) > 0
+
+    def road_between(self, left_fit, right_fit):
+        """ Cells of the grid whose centre is between the two fitted lanes (x = a*y**2 + b*y + c). """
+        v = self.cell_v[:, np.newaxis]
+        u = self.cell_u[np.newaxis, :]
+        return (u >= np.polyval(left_fit, v)) & (u <= np.polyval(right_fit, v))
+
+    def fill_bottom(self, grid):
+        """ The camera doesn't see directly in front, so we just tile the bottom row to fill in the gap. """
+        return np.vstack((grid, np.repeat(grid[-1:], self.fill_rows, axis=0)))
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+
+from projet.GridLayout import grid_to_rel
+
+
+
+"""
+    Robot-centred rolling occupancy map, used by the lidar process.
+
+    The map is a square log-odds buffer aligned with the odom frame, stored as a
+    circular buffer: the world cell (gx, gy) lives at [gx % size, gy % size].
+    When the turtlebot moves, only the rows/columns that enter the window are
+    cleared, nothing is copied or rebuilt.
+
+    Each scan is ray cast in one vectorized pass: cells along the beams get a
+    "miss", the cells where the beams end get a "hit". Unknown cells stay at 0.
+"""
+
+
+
+class RollingMap:
+    def __init__(self, size, cpm=50, hit=0.85, miss=-0.4, l_min=-2.0, l_max=3.5, occ_thresh=0.6, free_thresh=-0.4):
+        self.size = size
+        self.cpm = cpm
+        self.hit = hit
+        self.miss = miss
+        self.l_min = l_min
+        self.l_max = l_max
+        self.occ_thresh = occ_thresh
+        self.free_thresh = free_thresh
+
+        self.logodds = np.zeros((size, size), dtype=np.float32)
+
+        #World cell at the centre of the window (None until the first scan)
+        self.center = None
+
+        #Relative positions of the cells of the output grids, per shape
+        self._rel_cache = {}
+
+    def _world_cells(self, x, y):
+        return np.floor(x * self.cpm).astype(np.int64), np.floor(y * self.cpm).astype(np.int64)
+
+    def _flat_index(self, gx, gy):
+        return (gx % self.size) * self.size + (gy % self.size)
+
+    def _clear(self, old, new, axis):
+        """
+            Clear the rows (axis 0) or columns (axis 1) that entered the window when moving the centre from old to new.
+        """
+        half = self.size // 2
+        if abs(new - old) >= self.size:
+            entered = np.arange(self.size)
+        elif new > old:
+            entered = np.arange(old + self.size - half, new + self.size - half) % self.size
+        else:
+            entered = np.arange(new - half, old - half) % self.size
+
+        if axis == 0:
+            self.logodds[entered, :] = 0
+        else:
+            self.logodds[:, entered] = 0
+
+    def scroll(self, pos):
+        """
+            Move the window so it is centred on the turtlebot.
+        """
+        cx, cy = self._world_cells(pos[0], pos[1])
+        cx, cy = int(cx), int(cy)
+
+        if self.center is None:
+            self.logodds[:] = 0
+        else:
+            if cx != self.center[0]:
+                self._clear(self.center[0], cx, axis=0)
+            if cy != self.center[1]:
+                self._clear(self.center[1], cy, axis=1)
+
+        self.center = (cx, cy)
+
+    def integrate(self, ranges, thetas, pos, theta):
+        """
+            Fuse one scan. ranges and thetas are the beams in the turtle frame, pos and theta the odom pose.
+        """
+        self.scroll(pos)
+
+        ranges = np.asarray(ranges, dtype=float)
+        max_range = (self.size // 2 - 2) / self.cpm
+
+        valid = ranges > 0 # 0 is a missing return
+        hits = valid & np.isfinite(ranges) & (ranges < max_range)
+
+        # Beams without a return (inf) are free up to the edge of the window
+        free_len = np.where(hits, ranges - 1 / self.cpm, max_range)
+        free_len = np.where(valid, free_len, 0)
+
+        angles = theta + np.asarray(thetas, dtype=float)
+        cos, sin = np.cos(angles), np.sin(angles)
+
+        # Half a cell between samples so we don't skip any cell
+        t = np.arange(0, max_range, 0.5 / self.cpm)
+        along = t[np.newaxis, :] < free_len[:, np.newaxis]
+
+        px = pos[0] + cos[:, np.newaxis] * t[np.newaxis, :]
+        py = pos[1] + sin[:, np.newaxis] * t[np.newaxis, :]
+        free_idx = np.unique(self._flat_index(*self._world_cells(px[along], py[along])))
+
+        hx = pos[0] + cos[hits] * ranges[hits]
+        hy = pos[1] + sin[hits] * ranges[hits]
+        hit_idx = np.unique(self._flat_index(*self._world_cells(hx, hy)))
+
+        free_idx = free_idx[~np.isin(free_idx, hit_idx)]
+
+        flat = self.logodds.reshape(-1)
+        flat[free_idx] += self.miss
+        flat[hit_idx] += self.hit
+        np.clip(self.logodds, self.l_min, self.l_max, out=self.logodds)
+
+    def to_grid(self, pos, theta, shape, is_free, is_occupied, unknown=-1):
+        """
+            Sample the map into a grid of the given shape (canonical layout, see projet.GridLayout).
+        """
+        if not shape in self._rel_cache:
+            rows, cols = np.indices(shape)
+            self._rel_cache[shape] = grid_to_rel(np.stack((rows.ravel(), cols.ravel()), axis=-1), shape, self.cpm)
+        rel = self._rel_cache[shape]
+
+        c, s = math.cos(theta), math.sin(theta)
+        gx, gy = self._world_cells(pos[0] + c * rel[:, 0] - s * rel[:, 1], pos[1] + s * rel[:, 0] + c * rel[:, 1])
+
+        half = self.size // 2
+        inside = (np.abs(gx - self.center[0]) < half) & (np.abs(gy - self.center[1]) < half)
+
+        l = self.logodds.reshape(-1)[self._flat_index(gx, gy)]
+
+        grid = np.full(rel.shape[0], unknown, dtype=np.int8)
+        grid[inside & (l < self.free_thresh)] = is_free
+        grid[inside & (l > self.occ_thresh)] = is_occupied
+        return grid.reshape(shape)
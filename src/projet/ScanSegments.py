@@ -0,0 +1,69 @@
+import numpy as np
+
+
+
+"""
+    Bottle detection directly on the lidar ranges (no occupancy grid).
+
+    The scan is split into segments where consecutive beam ends are too far apart
+    (range discontinuities, missing returns). The size and centroid of every segment
+    come from one np.add.reduceat pass, and the segments that have the width of a
+    bottle and stand in front of their neighbours are bottle candidates. O(beams).
+"""
+
+
+
+class BottleScanDetector:
+    def __init__(self, jump=0.08, min_width=0.02, max_width=0.12, min_beams=2, max_range=2.0):
+        """
+            jump: distance (m) between consecutive beam ends that splits a segment.
+            min_width/max_width: chord (m) of a bottle segment, min_beams: beams on a bottle, max_range: ignore farther beams.
+        """
+        self.jump = jump
+        self.min_width = min_width
+        self.max_width = max_width
+        self.min_beams = min_beams
+        self.max_range = max_range
+
+    def detect(self, ranges, thetas):
+        """
+            Bottle candidates in the turtle frame (N x 2 array of x, y centres, in meters) and their widths.
+        """
+        ranges = np.asarray(ranges, dtype=float)
+        thetas = np.asarray(thetas, dtype=float)
+        n = len(ranges)
+        if n == 0:
+            return np.zeros((0, 2)), np.zeros(0)
+
+        with np.errstate(invalid='ignore'):
+            valid = np.isfinite(ranges) & (ranges > 0) & (ranges < self.max_range)
+        r = np.where(valid, ranges, 0.0)
+        x = r * np.cos(thetas)
+        y = r * np.sin(thetas)
+
+        # A new segment starts after a discontinuity, and every invalid beam is a segment of its own
+        new = np.ones(n, dtype=bool)
+        new[1:] = (np.hypot(np.diff(x), np.diff(y)) > self.jump) | ~valid[1:] | ~valid[:-1]
+
+        starts = np.flatnonzero(new)
+        ends = np.append(starts[1:], n) - 1
+        counts = ends - starts + 1
+
+        centre_x = np.add.reduceat(x, starts) / counts
+        centre_y = np.add.reduceat(y, starts) / counts
+        widths = np.hypot(x[ends] - x[starts], y[ends] - y[starts])
+
+        # A bottle stands in front of what is around it (missing returns count as far)
+        far = np.where(valid, ranges, np.inf)
+        before = np.where(starts > 0, far[np.maximum(starts - 1, 0)], np.inf)
+        after = np.where(ends < n - 1, far[np.minimum(ends + 1, n - 1)], np.inf)
+
+        keep = valid[starts] & (counts >= self.min_beams) & (widths >= self.min_width) & (widths <= self.max_width) \
+            & (before > ranges[starts]) & (after > ranges[ends])
+
+        # The beams hit the front of the bottle: push the centroid back by the radius
+        centre_x, centre_y, widths = centre_x[keep], centre_y[keep], widths[keep]
+        distance = np.hypot(centre_x, centre_y)
+        push = 1 + 0.5 * widths / np.maximum(distance, 1e-6)
+
+        return np.column_stack((centre_x * push, centre_y * push)), widths
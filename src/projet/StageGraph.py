@@ -0,0 +1,74 @@
+"""
+    Pipeline of stages that only run when one of their inputs changed.
+
+    An input is either a source (a function giving the current value, e.g. the
+    stamp of the last grid message) or another stage (its version, incremented
+    each time it runs). Each time the graph runs, the stages are run in the
+    order they were added, and a stage whose inputs are the same as the last
+    time it ran is skipped.
+"""
+
+
+
+class Stage:
+    __slots__ = ('name', 'function', 'inputs', 'key', 'version', 'executed', 'skipped')
+
+    def __init__(self, name, function, inputs):
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.key = None #Inputs of the last run
+        self.version = 0
+        self.executed = 0
+        self.skipped = 0
+
+
+
+class StageGraph:
+    def __init__(self):
+        self.sources = {}
+        self.stages = {} #By name, in execution order
+
+    def source(self, name, function):
+        self.sources[name] = function
+
+    def stage(self, name, function, inputs):
+        """
+            Add a stage, run after the ones already added. Its inputs are names of sources or of previous stages.
+        """
+        for i in inputs:
+            if not i in self.sources and not i in self.stages:
+                raise ValueError(f"Unknown input {i} of stage {name}")
+        self.stages[name] = Stage(name, function, inputs)
+
+    def value(self, name):
+        if name in self.stages:
+            return self.stages[name].version
+        return self.sources[name]()
+
+    def run(self):
+        """
+            Run the stages whose inputs changed. Returns the names of the stages that ran.
+        """
+        executed = []
+        for stage in self.stages.values():
+            key = tuple(self.value(i) for i in stage.inputs)
+            if key == stage.key:
+                stage.skipped += 1
+                continue
+
+            stage.function()
+            stage.key = key
+            stage.version += 1
+            stage.executed += 1
+            executed.append(stage.name)
+        return executed
+
+    def counts(self):
+        """
+            {stage: (executed, skipped)}
+        """
+        return {stage.name: (stage.executed, stage.skipped) for stage in self.stages.values()}
+
+    def stats(self):
+        return ", ".join(f"{name} {executed} run/{skipped} skipped" for name, (executed, skipped) in self.counts().items())
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from projet.BottleTracker import BottleTracker
+
+
+
+def make_tracker():
+    tracker = BottleTracker(gate=0.12)
+    for x in (0.0, 0.46, 0.9, 1.36):
+        tracker.add((x, 0.0))
+    return tracker
+
+
+def test_two_detections_of_one_bottle():
+    tracker = make_tracker()
+    detections = np.array([[0.01, 0.0], [0.02, 0.0]])
+
+    _, matched, unmatched = tracker.update(detections)
+
+    assert len(matched) == 1 and len(unmatched) == 1
+    assert len(tracker.new_detections(detections, unmatched)) == 0
+
+
+def test_close_new_detections_are_one_bottle():
+    tracker = make_tracker()
+    detections = np.array([[3.0, 0.0], [3.03, 0.0], [4.0, 0.0]])
+
+    _, matched, unmatched = tracker.update(detections)
+
+    assert len(matched) == 0
+    assert tracker.new_detections(detections, unmatched).tolist() == [0, 2]